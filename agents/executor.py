@@ -9,30 +9,41 @@ from autogen_core import (
     type_subscription,
 )
 from autogen_core.models import ChatCompletionClient, SystemMessage, UserMessage
-from dataclass import ReviewExecute, TASK_CONTEXT_MAPPING, executor_topic_type, verifier_topic_type, Message, TaskContext, ExecuteTask, ExecutorResults, VerifyTask
-from prompts import SYS_PROMPT_EXECUTOR
-from autogen import ConversableAgent
-from autogen.coding import LocalCommandLineCodeExecutor
-import tempfile
+from dataclass import ReviewExecute, TASK_CONTEXT_MAPPING, executor_topic_type, verifier_topic_type, Message, TaskContext, ExecuteTask, ExecutorResults, VerifyTask, VerifierResults, OutputTask, output_topic_type
+from prompts import SYS_PROMPT_EXECUTOR, construct_executor_prompt, construct_executor_refine_prompt, construct_executor_retry_prompt
 from .utils import extract_formula
-import textwrap
-import io
-import sys
+from modules.prompt_budget import PromptBudgeter, fit_prompt
+from modules.code_execution import CodeRunner, ExecutionResult
+from typing import List, Optional, Tuple
+from collections import Counter
+from functools import partial
 import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 @type_subscription(topic_type=executor_topic_type)
 class ExecutorAgent(RoutedAgent):
-    def __init__(self, model_client: ChatCompletionClient) -> None:
+    def __init__(
+            self,
+            model_client: ChatCompletionClient,
+            prompt_budgeter: Optional[PromptBudgeter] = None,
+            code_runner: Optional[CodeRunner] = None,
+            num_candidates: int = 1,
+            candidate_temperature: Optional[float] = None,
+            prompt_layout: str = "default"
+    ) -> None:
         super().__init__("A code executor agent.")
         self._system_message = SystemMessage(
             content=SYS_PROMPT_EXECUTOR
         )
         self._model_client = model_client
-
-    def _has_code_error(self, output: str) -> bool:
-        error_keywords = ["Traceback", "NameError", "SyntaxError", "TypeError", "ValueError", "IndexError","KeyError", "AttributeError", "Error"]
-        return any(keyword in output for keyword in error_keywords)
+        self._prompt_budgeter = prompt_budgeter
+        self._code_runner = code_runner or CodeRunner()
+        self.num_candidates = num_candidates  # > 1: sample candidates in parallel and vote on their answers
+        self.candidate_temperature = candidate_temperature
+        self.prompt_layout = prompt_layout
 
     @message_handler
     async def handle_execute_task(self, message: ExecuteTask, ctx: MessageContext) -> None:
@@ -40,31 +51,35 @@ class ExecutorAgent(RoutedAgent):
         task_context = TASK_CONTEXT_MAPPING[task_id]
         formula = task_context.reasoner_task.get_formula_from_reason()
 
+        extracted_values = task_context.extractor_task.get_extracted_var()
         if not task_context.executor_task or not task_context.executor_task.results:
-            prompt = (f"Please NOTE You are tasked with writing Python code based on the provided context.THINK THIS STEP BY STEP"
-                      f"Here is the formula from other assistant {formula} \n"
-                      f"Here is the extracted value {task_context.extractor_task.get_extracted_var()}.\n"
-                      f"Here is the question to answer {task_context.input_data.question}.\n"
-                      f"Make sure that initialize extracted value at the start of your code.\n"
-                      f"IGNORE THE symbol like $, million.... ONLY FOCUS ON NUMBERS  "
-                      f"You need to end with code by print(answer). And answer within 10 lines of code."
-                      f"** ALWAYS REMEMBER THE Instructions.")
+            prompt = fit_prompt(
+                self._prompt_budgeter,
+                render=partial(construct_executor_prompt, layout=self.prompt_layout),
+                parts={"formula": formula, "extracted_values": extracted_values, "question": task_context.input_data.question},
+                trim_order=[("extracted_values", "head"), ("formula", "head")],
+                overhead=self._system_message.content
+            )
         else:
             review_results = task_context.executor_task.results[-1].review
-            prompt = (f"Please NOTE You are tasked with writing Python code based on the provided context. THINK THIS STEP BY STEP"
-                      f"Here is the formula other assistant {formula} \n"
-                      f"Here is the extracted value {task_context.extractor_task.get_extracted_var()}.\n"
-                      f"Make sure that initialize extracted value at the start of your code.\n"
-                      f"Your previous code: f{task_context.executor_task.get_code()}"
-                      f"Here are the comments from the Verifier agent to help you refine your answer: {review_results}\n"
-                      f"IGNORE THE symbol like $, million.... ONLY FOCUS ON NUMBERS "
-                      f"Refine your code accordingly. Ensure it ends with print(answer) and within 10 lines."
-                      f"** ALWAYS REMEMBER THE Instructions.")
+            # The verifier review is trimmed first and keeps its newest (last) comments.
+            prompt = fit_prompt(
+                self._prompt_budgeter,
+                render=partial(construct_executor_refine_prompt, question=task_context.input_data.question, layout=self.prompt_layout),
+                parts={"formula": formula, "extracted_values": extracted_values,
+                       "previous_code": task_context.executor_task.get_code(), "review": review_results},
+                trim_order=[("review", "tail"), ("previous_code", "head"), ("extracted_values", "head"), ("formula", "head")],
+                overhead=self._system_message.content
+            )
+
+        if self.num_candidates > 1:
+            await self.execute_with_candidates(message, task_context, prompt, ctx)
+            return
 
         max_attempts = 3
         attempt = 0
-        code_res = ""
         response = ""
+        execution = None
         re_prompt = prompt
 
         while attempt < max_attempts:
@@ -75,46 +90,118 @@ class ExecutorAgent(RoutedAgent):
             response = llm_result.content
             assert isinstance(response, str)
 
-            try:
-                code_res_cli = await asyncio.wait_for(
-                    asyncio.to_thread(self._run_code_sync, response),
-                    timeout=10
-                )
-            except asyncio.TimeoutError:
-                code_res_cli = "Execution timed out after 10 seconds."
-            #self.run_code(response)
-            code_res_inprocess = await self.execute_python_code(response)
-            #self.execute_python_code(response)
-
-            combined_output = (
-                f"Local Executor Output:\n{code_res_cli}\n\n"
-                f"In-Process Executor Output:\n{code_res_inprocess}"
-            )
+            execution = await self._code_runner.run(response)
+            logger.debug(f"Code execution {execution.status} in {execution.duration:.4f}s, cache {self._code_runner.stats()}")
 
-            if not self._has_code_error(code_res) and not self._has_code_error(code_res_inprocess):
-                code_res = combined_output
+            if execution.ok:
                 break
             else:
-                prompt = (
-                    f"Your previous code produced the following error:\n{combined_output}\n"
-                    f"{re_prompt}"
-                    f"Your previous Code: {response}"
+                prompt = fit_prompt(
+                    self._prompt_budgeter,
+                    render=partial(construct_executor_retry_prompt, layout=self.prompt_layout),
+                    parts={"error_output": execution.to_text(), "base_prompt": re_prompt, "previous_code": response},
+                    trim_order=[("error_output", "tail"), ("previous_code", "head"), ("base_prompt", "head")],
+                    overhead=self._system_message.content
                 )
                 attempt += 1
-                code_res = combined_output
 
+        code_res = self.record_result(message, task_context, response, execution)
+
+        review_execute = ReviewExecute(
+            task_id=message.task_id,
+            code=response,
+            code_res=code_res,
+        )
+        await self.publish_message(review_execute, topic_id=TopicId(verifier_topic_type, source=self.id.key))
+
+    def record_result(self, message: ExecuteTask, task_context: TaskContext, response: str, execution: Optional[ExecutionResult]) -> str:
+        """
+        Append the attempt to the task's executor results and return the execution output text.
+        """
+        code_res = execution.to_text() if execution else ""
         executor_res = ExecutorResults(
             code=response,
             answer=code_res,
             review="pending" if not task_context.executor_task or not task_context.executor_task.results else
-            task_context.executor_task.results[-1].review
+            task_context.executor_task.results[-1].review,
+            status=execution.status if execution else "",
+            exception_type=execution.exception_type if execution else None
         )
 
         if not task_context.executor_task:
             task_context.executor_task = ExecuteTask(task=message.task, task_id=message.task_id)
 
         task_context.executor_task.results.append(executor_res)
+        return code_res
+
+    async def generate_candidates(self, prompt: str, ctx: MessageContext) -> List[Tuple[str, ExecutionResult]]:
+        """
+        Sample num_candidates programs concurrently and execute them in parallel.
+        The OpenAI client rejects `n`, so candidates are separate requests with distinct seeds,
+        which vLLM batches together and serves from the shared prompt prefix. With client batching
+        enabled they are coalesced into one /completions request, sent without a seed.
+        """
+        extra_create_args = [{"seed": i} for i in range(self.num_candidates)]
+        if self.candidate_temperature is not None:
+            for args in extra_create_args:
+                args["temperature"] = self.candidate_temperature
 
+        llm_results = await asyncio.gather(
+            *(self._model_client.create(
+                messages=[self._system_message, UserMessage(content=prompt, source=self.id.key)],
+                extra_create_args=args,
+                cancellation_token=ctx.cancellation_token,
+            ) for args in extra_create_args),
+            return_exceptions=True
+        )
+        responses = []
+        for llm_result in llm_results:
+            if isinstance(llm_result, BaseException):
+                logger.error(f"Candidate generation failed: {llm_result}")
+            elif isinstance(llm_result.content, str):
+                responses.append(llm_result.content)
+
+        executions = await asyncio.gather(*(self._code_runner.run(response) for response in responses))
+        return list(zip(responses, executions))
+
+    def vote(self, candidates: List[Tuple[str, ExecutionResult]]) -> Tuple[Optional[int], int]:
+        """
+        Group successful candidates by their printed answer. Returns the index of a candidate from the
+        largest group (or the first candidate when none ran) and the size of that group.
+        """
+        answers = {i: normalize_answer(execution.stdout) for i, (_, execution) in enumerate(candidates) if execution.ok}
+        answers = {i: answer for i, answer in answers.items() if answer}
+        if not answers:
+            return (0 if candidates else None), 0
+        answer, votes = Counter(answers.values()).most_common(1)[0]
+        return next(i for i, a in answers.items() if a == answer), votes
+
+    async def execute_with_candidates(self, message: ExecuteTask, task_context: TaskContext, prompt: str, ctx: MessageContext) -> None:
+        candidates = await self.generate_candidates(prompt, ctx)
+        index, votes = self.vote(candidates)
+        if index is None:
+            logger.error(f"No executor candidates were generated for task {message.task_id}.")
+            response, execution = "", None
+        else:
+            response, execution = candidates[index]
+        code_res = self.record_result(message, task_context, response, execution)
+
+        if votes * 2 > self.num_candidates:
+            # A strict majority of the requested candidates printed the same answer, skip the verifier loop.
+            logger.info(f"Task {message.task_id}: {votes}/{self.num_candidates} executor candidates agree, accepting the answer.")
+            task_context.verify_task = VerifyTask(task="", task_id=message.task_id)
+            task_context.verify_task.results.append(VerifierResults(
+                session_id="",
+                reasoner_comment="",
+                extractor_comment="",
+                executor_comment=f"Accepted without review: {votes} of {self.num_candidates} executor candidates printed the same answer.",
+                approved=True,
+            ))
+            output_task = OutputTask(task="", task_id=message.task_id)
+            await self.publish_message(output_task, topic_id=TopicId(output_topic_type, source=self.id.key))
+            return
+
+        logger.info(f"Task {message.task_id}: executor candidates disagree ({votes}/{self.num_candidates}), sending to the verifier.")
         review_execute = ReviewExecute(
             task_id=message.task_id,
             code=response,
@@ -122,82 +209,16 @@ class ExecutorAgent(RoutedAgent):
         )
         await self.publish_message(review_execute, topic_id=TopicId(verifier_topic_type, source=self.id.key))
 
-    def _run_code_sync(self, message_with_code_block: str) -> str:
-        temp_dir = tempfile.TemporaryDirectory()
-        executor = LocalCommandLineCodeExecutor(
-            timeout=10,  # Timeout for each code execution in seconds.
-            work_dir=temp_dir.name,  # Use the temporary directory to store the code files.
-        )
-        code_executor_agent = ConversableAgent(
-            "code_executor_agent",
-            llm_config=False,  # Turn off LLM for this agent.
-            code_execution_config={"executor": executor},  # Use the local command line code executor.
-        )
-        # print(f"The code input:{'-' * 80}\n{self.id.type}:\n {message_with_code_block}")
-        reply = code_executor_agent.generate_reply(messages=[{"role": "user", "content": message_with_code_block}])
-        # print(f"The code output:{'-' * 80}\n{self.id.type}:\n {reply}")
-        return reply
-
-    # def execute_python_code(self, code: str) -> str:
-    #
-    #     code = textwrap.dedent(code).lstrip()
-    #
-    #     old_stdout = sys.stdout
-    #     sys.stdout = buffer = io.StringIO()
-    #     try:
-    #         exec(code, {})  # Execute in an isolated global namespace.
-    #     except Exception as e:
-    #         result = f"Error during code execution: {e}"
-    #     else:
-    #         result = buffer.getvalue()
-    #     finally:
-    #         sys.stdout = old_stdout
-    #     return result.strip()
-    #
-    #
-    # def _run_code_sync(self, message_with_code_block: str) -> str:
-    #     """
-    #     Synchronous helper function for run_code.
-    #     """
-    #     temp_dir = tempfile.TemporaryDirectory()
-    #     executor = LocalCommandLineCodeExecutor(
-    #         timeout=10,  # Timeout for each code execution in seconds.
-    #         work_dir=temp_dir.name,  # Use the temporary directory to store the code files.
-    #     )
-    #     code_executor_agent = ConversableAgent(
-    #         "code_executor_agent",
-    #         llm_config=False,  # Turn off LLM for this agent.
-    #         code_execution_config={"executor": executor},  # Use the local command line code executor.
-    #     )
-    #     # Generate the reply from the local executor.
-    #     reply = code_executor_agent.generate_reply(
-    #         messages=[{"role": "user", "content": message_with_code_block}]
-    #     )
-    #     # Cleanup the temporary directory
-    #     temp_dir.cleanup()
-    #     return reply
-
-    async def execute_python_code(self, code: str) -> str:
-        """
-        Asynchronously execute Python code in-process.
-        """
-        return await asyncio.to_thread(self._execute_python_code_sync, code)
-
-    def _execute_python_code_sync(self, code: str) -> str:
-        """
-        Synchronous helper function to execute Python code.
-        """
-        code = textwrap.dedent(code).lstrip()
-
-        old_stdout = sys.stdout
-        sys.stdout = buffer = io.StringIO()
-        try:
-            exec(code, {})  # Execute in an isolated global namespace.
-        except Exception as e:
-            result = f"Error during code execution: {e}"
-        else:
-            result = buffer.getvalue()
-        finally:
-            sys.stdout = old_stdout
-        return result.strip()
 
+def normalize_answer(stdout: str) -> str:
+    """
+    The last printed line, with numbers rounded so that 9.34 and 9.340000001 count as the same answer.
+    """
+    lines = [line.strip() for line in stdout.strip().splitlines() if line.strip()]
+    if not lines:
+        return ""
+    last = lines[-1].replace(",", "").rstrip("%")
+    try:
+        return repr(round(float(last), 4))
+    except ValueError:
+        return lines[-1]
@@ -12,62 +12,106 @@ from autogen_core.models import ChatCompletionClient, SystemMessage, UserMessage
 from dataclass import ReviewExtractResults, ReviewExtract, TASK_CONTEXT_MAPPING, extractor_topic_type, executor_topic_type, ExtractTask, ReasonTask, ReasonerResults, ExecuteTask, \
     TaskContext, ExtractorResults,verifier_topic_type
 from prompts import SYS_PROMPT_EXTRACTOR,construct_extractor_prompt_1_turn
-from typing import Dict, List
+from typing import Dict, List, Optional
+from functools import partial
 from modules.bm25 import BM25Model
-from .utils import extract_variables
+from modules.prompt_budget import PromptBudgeter, fit_prompt
+from .utils import extract_variables, estimate_tokens, format_chunks
+import logging
+
+logger = logging.getLogger(__name__)
 
 @type_subscription(topic_type=extractor_topic_type)
 class ExtractorAgent(RoutedAgent):
-    def __init__(self, model_client: ChatCompletionClient, top_n_chunk: int) -> None:
+    def __init__(
+            self,
+            model_client: ChatCompletionClient,
+            top_n_chunk: int,
+            bm25_cache_size: int = 128,
+            context_mode: str = "full",
+            context_token_budget: int = 2048,
+            prompt_budgeter: Optional[PromptBudgeter] = None,
+            prompt_layout: str = "default"
+    ) -> None:
         super().__init__("A extractor agent.")
         self._system_message = SystemMessage(
             content=SYS_PROMPT_EXTRACTOR
         )
         self._model_client = model_client
         self._session_memory: Dict[str, List[ ReasonTask | ReasonerResults]] = {}
-        self._bm25_model = BM25Model(model_name="BM25_Extractor", top_k=top_n_chunk)
-        self.current_question = ""
-        self.current_context = ""
-        self.task_id = ""
+        # Filings are shared across many questions, so built BM25 indexes are cached by context hash.
+        self._bm25_model = BM25Model(model_name="BM25_Extractor", top_k=top_n_chunk, cache_size=bm25_cache_size, keep_tables_whole=True)
+        if context_mode not in ("full", "bm25", "budget"):
+            raise ValueError(f"Unknown extractor context mode: {context_mode}")
+        self.context_mode = context_mode  # "full": whole document, "bm25": top-k chunks, "budget": best chunks within a token budget
+        self.context_token_budget = context_token_budget
+        self._prompt_budgeter = prompt_budgeter
+        self.prompt_layout = prompt_layout
 
     @message_handler
     async def handle_extract_task(self, message: ExtractTask, ctx: MessageContext) -> None:
-        self.task_id = message.task_id  # Set the current task_id
-        task_context = TASK_CONTEXT_MAPPING[self.task_id]
+        task_id = message.task_id
+        task_context = TASK_CONTEXT_MAPPING[task_id]
 
         raw_response =  task_context.reasoner_task.get_var_from_reason()
-        self.current_question = task_context.input_data.question
-        self.current_context = task_context.input_data.context
+        question = task_context.input_data.question
+        context = task_context.input_data.context
 
         variables = extract_variables(raw_response)
-        context = task_context.input_data.context
 
-        relevant_chunks = self._bm25_model.get_top_chunks(query=self.current_question, passage=context)
+        if context == None:
+            context = question
 
-        if self.current_context == None:
-            self.current_context = self.current_question
+        prompt_context = self.select_context(question=question, context=context)
 
-        prompt = construct_extractor_prompt_1_turn(variables=variables, relevant_chunks=self.current_context, input_question=self.current_question)
+        prompt = fit_prompt(
+            self._prompt_budgeter,
+            render=partial(construct_extractor_prompt_1_turn, layout=self.prompt_layout),
+            parts={"variables": variables, "relevant_chunks": prompt_context, "input_question": question},
+            trim_order=[("relevant_chunks", "head"), ("variables", "head")],
+            overhead=self._system_message.content
+        )
         # TODO need to abstract
         response = await self.send_request(prompt=prompt, ctx=ctx)
 
         #TODO for test extract
         executor_task = ExecuteTask(
             task="",
-            task_id=self.task_id
+            task_id=task_id
         )
         extractor_results = ExtractorResults(
             extracted_var_value=f"Variables: {variables} \n Extracted:{response}",
             review="not set",
         )
 
-        task_context.extractor_task = ExtractTask(task="", task_id=self.task_id)
+        task_context.extractor_task = ExtractTask(task="", task_id=task_id)
         task_context.extractor_task.results.append(extractor_results)
 
         await self.publish_message(executor_task, topic_id=TopicId(executor_topic_type, source=self.id.key))
 
         # TODO for verify agent
-        # await self.send_review_task(response=response)
+        # await self.send_review_task(task_id=task_id, response=response)
+
+    def select_context(self, question: str, context: str) -> str:
+        """
+        Returns the part of the document passed to the extractor prompt according to the context mode.
+        """
+        if self.context_mode == "full":
+            return context
+
+        if self.context_mode == "bm25":
+            relevant_chunks = self._bm25_model.get_top_chunks(query=question, passage=context)
+        else:
+            # Count chunk tokens the same way the prompt budget does, with the served model's tokenizer if loaded.
+            count_tokens = self._prompt_budgeter.count_tokens if self._prompt_budgeter is not None else estimate_tokens
+            relevant_chunks = self._bm25_model.get_chunks_within_budget(
+                query=question, passage=context, max_tokens=self.context_token_budget, count_tokens=count_tokens
+            )
+        logger.debug(f"BM25 index cache: {self._bm25_model.cache_info()}")
+
+        if not relevant_chunks:
+            return context
+        return format_chunks(relevant_chunks)
 
     async def send_request(self, prompt: str, ctx: MessageContext) -> str:
         """
@@ -81,11 +125,13 @@ class ExtractorAgent(RoutedAgent):
         assert isinstance(response, str)
         return response
 
-    async def send_review_task(self, response:str) -> None:
+    async def send_review_task(self, task_id: str, response:str) -> None:
+        input_data = TASK_CONTEXT_MAPPING[task_id].input_data
         review_task = ReviewExtract(
-            question=self.current_question,
-            context=self.current_context,
-            extraxt_results=response
+            question=input_data.question,
+            context=input_data.context,
+            extraxt_results=response,
+            task_id=task_id
         )
         await self.publish_message(review_task, topic_id=TopicId(verifier_topic_type, source=self.id.key))
 
@@ -93,7 +139,8 @@ class ExtractorAgent(RoutedAgent):
     async def handle_extract_review_res(self, message: ReviewExtractResults, ctx: MessageContext) -> None:
         response = await self.send_request(prompt=message.results, ctx=ctx)
 
-        task_context = TASK_CONTEXT_MAPPING.get(self.task_id)
+        task_id = message.task_id
+        task_context = TASK_CONTEXT_MAPPING.get(task_id)
 
         prompt = f"Based on the reviewed results： {response}, answer the question again  \n"
 
@@ -101,7 +148,7 @@ class ExtractorAgent(RoutedAgent):
 
         executor_task = ExecuteTask(
             task="",
-            task_id=self.task_id
+            task_id=task_id
         )
         variables = extract_variables(re_answer)
         extractor_results = ExtractorResults(
@@ -109,6 +156,6 @@ class ExtractorAgent(RoutedAgent):
             review=response,
         )
 
-        task_context.extractor_task = ExtractTask(task="", task_id=self.task_id)
+        task_context.extractor_task = ExtractTask(task="", task_id=task_id)
         task_context.extractor_task.results.append(extractor_results)
         await self.publish_message(executor_task, topic_id=TopicId(executor_topic_type, source=self.id.key))
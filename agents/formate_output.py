@@ -1,8 +1,5 @@
-import csv
-import json
 import os
-import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from autogen_core import (
     RoutedAgent,
     type_subscription,
@@ -10,17 +7,16 @@ from autogen_core import (
     message_handler
 )
 from dataclass import TASK_CONTEXT_MAPPING, TaskContext,output_topic_type,OutputTask
+from modules.result_writer import StreamingCSVWriter, ParquetResultWriter
 import logging
 logger = logging.getLogger(__name__)
-import sys
-import io
-import textwrap
 @type_subscription(topic_type=output_topic_type)
 class FormateOutput(RoutedAgent):
-    def __init__(self, output_file: str, output_path: str):
+    def __init__(self, output_file: str, output_path: str, writer: Optional[StreamingCSVWriter | ParquetResultWriter] = None):
         super().__init__("Formated output.")
         self.output_path = output_path
         self.output_file = output_file
+        self.writer = writer or StreamingCSVWriter(file_path=os.path.join(output_path, output_file))
 
     @message_handler
     async def handle_output(self, message: OutputTask, ctx: MessageContext) -> None:
@@ -29,7 +25,7 @@ class FormateOutput(RoutedAgent):
             task_id = message.task_id
             task_context = TASK_CONTEXT_MAPPING[task_id]
             final_output = self.generate(task_context)
-            self.save(final_output)
+            await self.save(final_output, fingerprint=task_context.fingerprint)
 
         except Exception as e:
             logging.error(f"Error in FinalOutputAgent: {e}")
@@ -53,58 +49,26 @@ class FormateOutput(RoutedAgent):
                 }
         return final_output
 
-    def save(self, final_output: Dict[str, Any]) -> str:
-        try:
-            os.makedirs(self.output_path, exist_ok=True)
-            file_path = os.path.join(self.output_path, self.output_file)
-            headers = [
-                "task",
-                "context",
-                "question",
-                "answer",
-                "program",
-                "model_output",
-                "evaluations",
-                "reasoner_output",
-                "reasoner_actions",
-                "extractor_output",
-                "executor_output",
-                "verifier_output",
-            ]
-
-            if not os.path.exists(file_path):
-                logger.info(f"File {file_path} does not exist. Creating a new file.")
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    writer = csv.DictWriter(f, fieldnames=headers)
-                    writer.writeheader()
-            try:
-                df_existing = pd.read_csv(file_path, on_bad_lines="skip")
-                logger.info(f"Existing data loaded from {file_path}.")
-            except pd.errors.ParserError as e:
-                logger.error(f"Error reading existing CSV file: {e}")
-                raise RuntimeError(f"Error reading existing CSV file: {e}") from e
-
-            new_row = {
-                "task": final_output.get("task_name", ""),
-                "context": final_output.get("context", ""),
-                "question": final_output.get("question", ""),
-                "answer": final_output.get("answer", ""),
-                "program": final_output.get("program", ""),
-                "model_output": final_output.get("model_output", ""),
-                "reasoner_output": final_output.get("reasoner_output", ""),
-                "reasoner_actions": final_output.get("reasoner_actions", ""),
-                "extractor_output": final_output.get("extractor_output", ""),
-                "executor_output": final_output.get("executor_output", ""),
-                "verifier_output": final_output.get("verifier_output", ""),
-            }
-            df_new = pd.DataFrame([new_row])
+    def to_row(self, final_output: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "task": final_output.get("task_name", ""),
+            "context": final_output.get("context", ""),
+            "question": final_output.get("question", ""),
+            "answer": final_output.get("answer", ""),
+            "program": final_output.get("program", ""),
+            "model_output": final_output.get("model_output", ""),
+            "evaluations": final_output.get("evaluations", ""),
+            "reasoner_output": final_output.get("reasoner_output", ""),
+            "reasoner_actions": final_output.get("reasoner_actions", ""),
+            "extractor_output": final_output.get("extractor_output", ""),
+            "executor_output": final_output.get("executor_output", ""),
+            "verifier_output": final_output.get("verifier_output", ""),
+        }
 
-            df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-
-            df_combined.to_csv(file_path, index=False, encoding='utf-8')
-
-            logger.info(f"Final output successfully saved to {file_path}.")
-            return file_path
+    async def save(self, final_output: Dict[str, Any], fingerprint: Optional[str] = None) -> str:
+        try:
+            await self.writer.write(self.to_row(final_output), fingerprint=fingerprint)
+            return self.writer.file_path
 
         except Exception as e:
-            raise RuntimeError(f"Failed to save final output as CSV: {e}") from e
\ No newline at end of file
+            raise RuntimeError(f"Failed to save final output to {self.writer.file_path}: {e}") from e
@@ -9,7 +9,10 @@ from autogen_core import (
 )
 from autogen_core.models import ChatCompletionClient, SystemMessage, UserMessage
 from dataclass import VerifyTask, verifier_topic_type, ActionResults,ReasonerActionTask, TASK_CONTEXT_MAPPING, ReasonTask, VerifierResults,Message, ReasonerResults, ExtractTask, reasoner_topic_type, extractor_topic_type,TaskContext
-from prompts import SYS_PROMPT_REASONER, construct_reason_prompt, ACTIONS, construct_action_evaluation_prompt
+from prompts import SYS_PROMPT_REASONER, construct_reason_prompt, ACTIONS
+from .utils import extract_score, extract_action_scores
+from modules.prompt_budget import PromptBudgeter, fit_prompt
+from dataclasses import replace
 from typing import Dict, List, Optional
 import uuid
 from mcts.mcts_custom import MCTS_Searcher_Custom
@@ -17,6 +20,7 @@ from mcts.reason_node import ReasoningNode
 import logging
 import asyncio
 import concurrent.futures
+import functools
 import re
 
 logging.getLogger('autogen_core').propagate = False
@@ -31,7 +35,12 @@ class ReasonerAgent(RoutedAgent):
             weight_scheduler: str = "exp",
             num_rollouts: int = 20,  # default should 20
             discount: float = 1.0,
-            verbose: bool = False
+            verbose: bool = False,
+            max_concurrent_rollouts: int = 1,
+            virtual_loss: float = 1.0,
+            scoring_mode: str = "single",
+            reward_timeout: float = 10,
+            prompt_budgeter: Optional[PromptBudgeter] = None
     ) -> None:
         super().__init__("A formula and variable identify agent.")
         self._system_message = SystemMessage(
@@ -39,56 +48,127 @@ class ReasonerAgent(RoutedAgent):
         )
         self._model_client = model_client
         self._session_memory: Dict[str, List[VerifierResults | ReasonTask]] = {}
-        self._mcts_searcher: Optional[MCTS_Searcher_Custom] = None
-        self.current_question = ""
-        self.current_context = ""
-        self.action_queue: asyncio.Queue = asyncio.Queue()
+        self._pending_rewards: Dict[str, asyncio.Future] = {}  # request_id -> future awaiting the verifier reply
+        self._reward_tables: Dict[str, Dict[str, asyncio.Future]] = {}  # task_id -> action -> future score
         self.default_reward = 0.0
+        self.scoring_mode = scoring_mode  # "single": one verifier call per action, "batch": one call scores all actions
+        self.reward_timeout = reward_timeout
+        self._prompt_budgeter = prompt_budgeter
 
         self._mcts_params = {
             "exploration_weight": exploration_weight,
             "weight_scheduler": weight_scheduler,
             "num_rollouts": num_rollouts,
             "discount": discount,
-            "verbose": verbose
+            "verbose": verbose,
+            "max_concurrent_rollouts": max_concurrent_rollouts,
+            "virtual_loss": virtual_loss
         }
 
-    async def get_reward_async(self, action: str) -> float:
-        future = asyncio.get_event_loop().create_future()
-        await self.action_queue.put(future)
+    async def get_reward_async(self, task_id: str, action: str) -> float:
+        """
+        Score an action once per task. Concurrent requests for the same action share one in-flight future.
+        """
+        reward_table = self._reward_tables.setdefault(task_id, {})
+        future = reward_table.get(action)
+        if future is None:
+            if self.scoring_mode == "batch":
+                self._request_batch_scores(task_id, action, reward_table)
+                future = reward_table[action]
+            else:
+                future = asyncio.ensure_future(self._score_action(task_id, action))
+                reward_table[action] = future
+
+        score = await asyncio.shield(future)
+        if score is None:
+            # Do not memoize failures, a later rollout may retry the action.
+            if reward_table.get(action) is future:
+                del reward_table[action]
+            return self.default_reward
+        return score
+
+    def _request_batch_scores(self, task_id: str, action: str, reward_table: Dict[str, asyncio.Future]) -> None:
+        """
+        Register futures for every action that has no score yet and fill them from one batched verifier call.
+        """
+        actions = [a for a in ACTIONS if a not in reward_table]
+        if action not in actions:
+            actions.append(action)
+        loop = asyncio.get_event_loop()
+        futures = {a: loop.create_future() for a in actions}
+        reward_table.update(futures)
+        asyncio.ensure_future(self._score_actions_batch(task_id, futures))
+
+    async def _score_action(self, task_id: str, action: str) -> Optional[float]:
+        input_data = TASK_CONTEXT_MAPPING[task_id].input_data
+        # The verifier renders the prompt, so that it is budgeted against the verifier's own system message.
+        action_task = ReasonerActionTask(task="", action=action, question=input_data.question, context=input_data.context)
 
-        asyncio.create_task(self.action_to_verifier(action))
         logger.info(f"Submitted action '{action}' for evaluation. Awaiting score...")
+        results = await self.request_verifier_score(action_task)
+        if results is None:
+            return None
+        score = extract_score(results)
+        if score is None:
+            logger.warning("No 'score' field found in the message. Defaulting to 0.0.")
+            score = self.default_reward
+        logger.info(f"Received score {score} for action '{action}'.")
+        return score
+
+    async def _score_actions_batch(self, task_id: str, futures: Dict[str, asyncio.Future]) -> None:
+        input_data = TASK_CONTEXT_MAPPING[task_id].input_data
+        action_task = ReasonerActionTask(
+            task="", action="", question=input_data.question,
+            context=input_data.context, actions=list(futures.keys())
+        )
+
+        logger.info(f"Submitted {len(futures)} actions for batched evaluation. Awaiting scores...")
+        results = await self.request_verifier_score(action_task)
+        scores = extract_action_scores(results, list(futures.keys())) if results is not None else {}
+        for action, future in futures.items():
+            if not future.done():
+                # Actions missing from the reply resolve to None and are re-requested on demand.
+                future.set_result(scores.get(action))
+        logger.info(f"Received batched scores {scores}.")
+
+    async def request_verifier_score(self, action_task: ReasonerActionTask) -> Optional[str]:
+        """
+        Send a scoring request to the verifier and wait for the reply carrying the same request id.
+        Returns the raw verifier response, or None on timeout or error.
+        """
+        request_id = str(uuid.uuid4())
+        action_task.request_id = request_id
+        future = asyncio.get_event_loop().create_future()
+        self._pending_rewards[request_id] = future
+
         try:
-            score = await asyncio.wait_for(future, timeout=10)  #  # Adjust timeout as needed
-            logger.info(f"Received score {score} for action '{action}'.")
-        except concurrent.futures.TimeoutError:
+            await self.publish_message(message=action_task, topic_id=TopicId(verifier_topic_type, source=self.id.key))
+            return await asyncio.wait_for(future, timeout=self.reward_timeout)
+        except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
             logger.error("Timeout while waiting for VerifierAgent response.")
-            score = 0.0
+            return None
         except Exception as e:
             logger.error(f"Error while fetching reward: {e}")
-            score = 0.0
+            return None
+        finally:
+            self._pending_rewards.pop(request_id, None)
 
-        return score
-
-    @property
-    def mcts_searcher(self) -> MCTS_Searcher_Custom:
+    def create_mcts_searcher(self, task_id: str) -> MCTS_Searcher_Custom:
         """
-        Lazy initializer for MCTS_Searcher_Custom.
+        Build a fresh MCTS_Searcher_Custom for one task, so concurrent tasks never share a tree.
         """
-        if self._mcts_searcher is None:
-            self._mcts_searcher = MCTS_Searcher_Custom(
-                exploration_weight=self._mcts_params["exploration_weight"],
-                weight_scheduler=self._mcts_params["weight_scheduler"],
-                num_rollouts=self._mcts_params["num_rollouts"],
-                discount=self._mcts_params["discount"],
-                get_reward_func=self.get_reward_async,
-                verbose=self._mcts_params["verbose"]
-            )
-            logger.info("Initialized MCTS_Searcher_Custom.")
-        return self._mcts_searcher
+        return MCTS_Searcher_Custom(
+            exploration_weight=self._mcts_params["exploration_weight"],
+            weight_scheduler=self._mcts_params["weight_scheduler"],
+            num_rollouts=self._mcts_params["num_rollouts"],
+            discount=self._mcts_params["discount"],
+            get_reward_func=functools.partial(self.get_reward_async, task_id),
+            verbose=self._mcts_params["verbose"],
+            max_concurrent_tasks=self._mcts_params["max_concurrent_rollouts"],
+            virtual_loss=self._mcts_params["virtual_loss"]
+        )
 
-    async def perform_mcts_search(self) -> List[str]:
+    async def perform_mcts_search(self, task_id: str) -> List[str]:
         try:
             initial_state = {
                 'actions_taken': [],
@@ -99,7 +179,7 @@ class ReasonerAgent(RoutedAgent):
             root_node = ReasoningNode(state=initial_state)
 
             logger.info("Starting MCTS rollouts.")
-            best_action_sequence = await self.mcts_searcher.run_rollouts(root_node)
+            best_action_sequence = await self.create_mcts_searcher(task_id).run_rollouts(root_node)
             logger.info(f"Completed MCTS rollouts. Best Action Sequence: {best_action_sequence}")
 
             return best_action_sequence
@@ -111,13 +191,21 @@ class ReasonerAgent(RoutedAgent):
     async def handle_reason_task(self, message: ReasonTask, ctx: MessageContext) -> None:
         task_id = message.task_id
         task_context = TASK_CONTEXT_MAPPING[task_id]
-        prompt = construct_reason_prompt(task_context.input_data)
+        prompt = fit_prompt(
+            self._prompt_budgeter,
+            render=lambda context: construct_reason_prompt(replace(task_context.input_data, context=context)),
+            parts={"context": task_context.input_data.context},
+            trim_order=[("context", "head")],
+            overhead=self._system_message.content
+        )
         session_id = str(uuid.uuid4())
         self._session_memory.setdefault(session_id, []).append(message)
-        self.current_question = task_context.input_data.question
-        self.current_context = task_context.input_data.context
+        self._reward_tables[task_id] = {}
 
-        best_action_sequence = await self.perform_mcts_search()
+        try:
+            best_action_sequence = await self.perform_mcts_search(task_id)
+        finally:
+            self._reward_tables.pop(task_id, None)
 
         if not best_action_sequence:
             logger.error("MCTS failed to determine a best action sequence. Aborting task.")
@@ -182,51 +270,13 @@ class ReasonerAgent(RoutedAgent):
         """
         return aggregated_response.strip()
 
-    async def action_to_verifier(self, action: str) -> None:
-        try:
-            prompt = construct_action_evaluation_prompt(current_question=self.current_question, current_context=self.current_context,action=action)
-            action_task = ReasonerActionTask(task="", action=prompt, question=self.current_question)
-            await self.publish_message(message=action_task, topic_id=TopicId(verifier_topic_type, source=self.id.key))
-
-        except asyncio.TimeoutError:
-            logger.error("Timeout while sending action to VerifierAgent.")
-            if not self.action_queue.empty():
-                future = await self.action_queue.get()
-                if not future.done():
-                    future.set_result(0.0)  # Assign default score
-                    logger.info("Assigned default score 0.0 due to timeout.")
-        except Exception as e:
-            logger.error(f"Error while sending action to VerifierAgent: {e}")
-            if not self.action_queue.empty():
-                future = await self.action_queue.get()
-                if not future.done():
-                    future.set_result(0.0)  # Assign default score
-                    logger.info("Assigned default score 0.0 due to error.")
-
-
     @message_handler
     async def get_action_score(self, message:ActionResults, ctx: MessageContext) -> None:
-        json_str = message.results
-        pattern = r'"score"\s*:\s*([0-9]*\.?[0-9]+)'
-
-        match = re.search(pattern, json_str)
-        if match:
-            try:
-                score = float(match.group(1))
-                logger.info(f"Extracted score using regex: {score}")
-            except ValueError:
-                logger.warning(f"Invalid score format: {match.group(1)}. Defaulting to 0.0.")
-                score = self.default_reward
-        else:
-            logger.warning("No 'score' field found in the message. Defaulting to 0.0.")
-            score = self.default_reward
-
-        if not self.action_queue.empty():
-            future = await self.action_queue.get()
-            if not future.done():
-                future.set_result(float(score))
-                logger.info(f"Score {score} set in the next action's Future.")
-            else:
-                logger.warning("Future is already done. Cannot set result.")
+        future = self._pending_rewards.get(message.request_id)
+        if future is None:
+            logger.warning(f"No pending request {message.request_id!r}, it may have timed out. Ignoring the score.")
+        elif future.done():
+            logger.warning("Future is already done. Cannot set result.")
         else:
-            logger.warning("No pending action in the queue. Ignoring the score.")
\ No newline at end of file
+            future.set_result(message.results)
+            logger.info(f"Verifier reply set for request {message.request_id}.")
@@ -1,6 +1,8 @@
 import re
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+from modules.prompt_budget import estimate_tokens
 
 
 def extract_variables(input_text: str) -> str:
@@ -15,6 +17,13 @@ def extract_variables(input_text: str) -> str:
     else:
         return "No 'variables' block found."
 
+def format_chunks(chunks: List[Dict[str, Any]]) -> str:
+    """
+    Joins retrieved chunks into a single context block for a prompt.
+    """
+    return "\n\n".join(chunk["chunk"] for chunk in chunks)
+
+
 def split_variables_from_formula(input_text: str):
     variable_pattern = r'\b[A-Za-z_][A-Za-z0-9_]*\b'
 
@@ -63,6 +72,59 @@ def extract_approved(input_text: str) -> bool:
     else:
         return False
 
+def extract_score(input_text: str) -> Optional[float]:
+    """
+    Extracts the numerical "score" field from a verifier response.
+    """
+    match = re.search(r'"score"\s*:\s*([0-9]*\.?[0-9]+)', input_text)
+    if not match:
+        return None
+    try:
+        return float(match.group(1))
+    except ValueError:
+        return None
+
+
+# A number followed by a character that cannot continue it, so that "0." or "0.8" at the end of a
+# partially streamed response (which may still become "0.85") does not count as a complete score.
+COMPLETE_NUMBER_PATTERN = r'[0-9]*\.?[0-9]+(?=[^0-9.])'
+
+
+def score_complete(input_text: str) -> bool:
+    """
+    Whether a partial verifier response already contains its complete "score" field.
+    """
+    return re.search(r'"score"\s*:\s*' + COMPLETE_NUMBER_PATTERN, input_text) is not None
+
+
+def action_scores_complete(input_text: str, actions: List[str]) -> bool:
+    """
+    Whether a partial batched verifier response already contains a complete score for every action.
+    """
+    return all(re.search(rf'"{re.escape(action)}"\s*:\s*' + COMPLETE_NUMBER_PATTERN, input_text) for action in actions)
+
+
+def approved_complete(input_text: str) -> bool:
+    """
+    Whether a partial review already contains the "Approved" field read by extract_approved.
+    """
+    return re.search(r'"Approved"\s*:\s*(true|false)\b', input_text, re.IGNORECASE) is not None
+
+
+def extract_action_scores(input_text: str, actions: List[str]) -> Dict[str, Optional[float]]:
+    """
+    Extracts the score of each action from a batched verifier response such as
+    {"scores": {"REASON_ACTION_CLARIFY": 0.8, ...}}. Missing or malformed scores map to None.
+    """
+    scores = {}
+    for action in actions:
+        match = re.search(rf'"{re.escape(action)}"\s*:\s*([0-9]*\.?[0-9]+)', input_text)
+        try:
+            scores[action] = float(match.group(1)) if match else None
+        except ValueError:
+            scores[action] = None
+    return scores
+
 def recursive_extract_formula(data):
     """
     Recursively search through a dict or list for keys named "formula"
@@ -7,15 +7,25 @@ from autogen_core import (
     message_handler,
     type_subscription,
 )
-from autogen_core.models import ChatCompletionClient, SystemMessage, UserMessage
+from autogen_core.models import ChatCompletionClient, LLMMessage, SystemMessage, UserMessage
 from dataclass import executor_topic_type,ExecuteTask, ReviewExecute, extractor_topic_type, ReviewExtractResults, ReviewExtract, reasoner_topic_type, ActionResults,ReasonerActionTask, TASK_CONTEXT_MAPPING, verifier_topic_type, Message, TaskContext, VerifyTask, OutputTask, output_topic_type, VerifierResults
-from prompts import SYS_PROMPT_VERIFICATION, construct_review_extractor_prompt, SYS_PROMPT_EXECUTE_VERIFICATION
+from prompts import SYS_PROMPT_VERIFICATION, construct_review_extractor_prompt, SYS_PROMPT_EXECUTE_VERIFICATION, construct_action_evaluation_prompt, construct_batch_action_evaluation_prompt, construct_execute_review_prompt
 from agents.rag.retrieval import FormulaRetriever
 import json
-from agents.utils import format_query_results,extract_approved
+from typing import Callable, Dict, List, Optional
+from functools import partial
+from modules.prompt_budget import PromptBudgeter, fit_prompt
+from agents.utils import format_query_results,extract_approved, score_complete, action_scores_complete, approved_complete
+from modules.streaming import create_until
 @type_subscription(topic_type=verifier_topic_type)
 class VerifierAgent(RoutedAgent):
-    def __init__(self, model_client: ChatCompletionClient) -> None:
+    def __init__(
+            self,
+            model_client: ChatCompletionClient,
+            prompt_budgeter: Optional[PromptBudgeter] = None,
+            prompt_layout: str = "default",
+            early_stop: bool = False
+    ) -> None:
         super().__init__("A verifier agent.")
         self._system_message = SystemMessage(
             content=SYS_PROMPT_VERIFICATION
@@ -25,7 +35,25 @@ class VerifierAgent(RoutedAgent):
         self._execute_review_message = SystemMessage(
             content=SYS_PROMPT_EXECUTE_VERIFICATION
         )
-        self.current_turn = 0
+        self._review_turns: Dict[str, int] = {}  # task_id -> executor review rounds so far
+        self._prompt_budgeter = prompt_budgeter
+        self.prompt_layout = prompt_layout
+        self.early_stop = early_stop  # stream scores and reviews, and stop each completion once its field is parsed
+        self.early_stops = 0
+
+    async def complete(self, messages: List[LLMMessage], ctx: MessageContext, stop_when: Callable[[str], bool]) -> str:
+        """
+        The response text. With early_stop the completion is streamed and cut off once stop_when(text) holds.
+        """
+        if self.early_stop:
+            response, stopped = await create_until(self._model_client, messages, stop_when, cancellation_token=ctx.cancellation_token)
+            if stopped:
+                self.early_stops += 1
+            return response
+        llm_result = await self._model_client.create(messages=messages, cancellation_token=ctx.cancellation_token)
+        response = llm_result.content
+        assert isinstance(response, str)
+        return response
 
 
     @message_handler
@@ -64,34 +92,50 @@ class VerifierAgent(RoutedAgent):
 
     @message_handler
     async def handle_reasoner_action(self, message: ReasonerActionTask, ctx: MessageContext) -> None:
-        prompt = message.action
-
         query_text = message.question
         query_results = self.formula_retriever.query_collection(query=query_text, n_results=2)
-
-        if query_results:
-            # Process query_results as needed
-            # For example, include query results in the prompt or use them in decision-making
-            # formatted_results = json.dumps(query_results, indent=4)
-            #TODO need to filter the formatted results
-            formatted_results = format_query_results(query_result=query_results)
-            prompt += f"\nHERE IS RELATED FORMULA TO HELP YOU DECIDE SCORE:\n{formatted_results}"
-
-        llm_result = await self._model_client.create(
-            messages=[self._system_message, UserMessage(content=prompt, source=self.id.key)],
-            cancellation_token=ctx.cancellation_token,
+        #TODO need to filter the formatted results
+        formulas = format_query_results(query_result=query_results) if query_results else ""
+
+        def render(context: str, formulas: str) -> str:
+            if message.actions:
+                # Batched mode: score all candidate actions against one copy of the context.
+                prompt = construct_batch_action_evaluation_prompt(current_question=message.question, current_context=context, actions=message.actions, layout=self.prompt_layout)
+            else:
+                prompt = construct_action_evaluation_prompt(current_question=message.question, current_context=context, action=message.action, layout=self.prompt_layout)
+            if formulas:
+                prompt += f"\nHERE IS RELATED FORMULA TO HELP YOU DECIDE SCORE:\n{formulas}"
+            return prompt
+
+        prompt = fit_prompt(
+            self._prompt_budgeter,
+            render=render,
+            parts={"context": message.context, "formulas": formulas},
+            trim_order=[("context", "head"), ("formulas", "head")],
+            overhead=self._system_message.content
         )
-        response = llm_result.content
-        assert isinstance(response, str)
+
+        if message.actions:
+            stop_when = partial(action_scores_complete, actions=message.actions)
+        else:
+            stop_when = score_complete
+        response = await self.complete([self._system_message, UserMessage(content=prompt, source=self.id.key)], ctx, stop_when)
         result = ActionResults(
-           results=response
+           results=response,
+           request_id=message.request_id
         )
 
         await self.publish_message(message=result, topic_id=TopicId(reasoner_topic_type, self.id.key))
 
     @message_handler
     async def handle_extract_review(self, message: ReviewExtract, ctx: MessageContext) -> None:
-        prompt = construct_review_extractor_prompt(question=message.question, context=message.context, extraxt_results=message.extraxt_results)
+        prompt = fit_prompt(
+            self._prompt_budgeter,
+            render=partial(construct_review_extractor_prompt, layout=self.prompt_layout),
+            parts={"question": message.question, "context": message.context, "extraxt_results": message.extraxt_results},
+            trim_order=[("context", "head"), ("extraxt_results", "tail")],
+            overhead=self._system_message.content
+        )
         llm_result = await self._model_client.create(
             messages=[self._system_message, UserMessage(content=prompt, source=self.id.key)],
             cancellation_token=ctx.cancellation_token,
@@ -100,7 +144,8 @@ class VerifierAgent(RoutedAgent):
         assert isinstance(response, str)
 
         result = ReviewExtractResults(
-            results=response
+            results=response,
+            task_id=message.task_id
         )
 
         await self.publish_message(message=result, topic_id=TopicId(extractor_topic_type, self.id.key))
@@ -111,27 +156,20 @@ class VerifierAgent(RoutedAgent):
         task_context = TASK_CONTEXT_MAPPING[task_id]
         max_turn = 6
 
-        if self.current_turn >= max_turn:
+        if self._review_turns.get(task_id, 0) >= max_turn:
             output_task = OutputTask(task="", task_id=message.task_id)
+            self._review_turns.pop(task_id, None)  # Reset the turn counter.
             await self.publish_message(message=output_task, topic_id=TopicId(output_topic_type, source=self.id.key))
-            self.current_turn = 0  # Reset the turn counter.
             return
 
-        prompt = f"""What’s the problem with the above code? You should check the code line by line. \n.
-        give your review comments: \n
-        executor agent code:  {message.code}\n code executed results: {message.code_res}
-        if there is ValueError, SyntaxError etc, you should set Approved: False
-        **Format your response as JSON** 
-        ...
-        End your response with: Approved: True or False.
-        """
-        #
-        llm_result = await self._model_client.create(
-            messages=[self._execute_review_message, UserMessage(content=prompt, source=self.id.key)],
-            cancellation_token=ctx.cancellation_token,
+        prompt = fit_prompt(
+            self._prompt_budgeter,
+            render=partial(construct_execute_review_prompt, layout=self.prompt_layout),
+            parts={"code": message.code, "code_res": message.code_res},
+            trim_order=[("code_res", "tail"), ("code", "head")],
+            overhead=self._execute_review_message.content
         )
-        response = llm_result.content
-        assert isinstance(response, str)
+        response = await self.complete([self._execute_review_message, UserMessage(content=prompt, source=self.id.key)], ctx, approved_complete)
 
         last_result = task_context.executor_task.results[-1]
         last_result.review = response
@@ -149,11 +187,11 @@ class VerifierAgent(RoutedAgent):
         # if approve
         if extract_approved(input_text=response):
             output_task = OutputTask(task="", task_id=message.task_id)
+            self._review_turns.pop(task_id, None)
             await self.publish_message(message=output_task, topic_id=TopicId(output_topic_type, source=self.id.key))
-            self.current_turn = 0
             return
 
-        self.current_turn += 1
+        self._review_turns[task_id] = self._review_turns.get(task_id, 0) + 1
         task_context.executor_task.update_review(review=response)
         executor_task = ExecuteTask(task="", task_id=task_id)
         await self.publish_message(executor_task, topic_id=TopicId(executor_topic_type, source=self.id.key))
\ No newline at end of file
@@ -17,6 +17,7 @@ class ReviewExtract:
     extraxt_results: str
     question: str
     context: str
+    task_id: str = ""
 
 @dataclass
 class ReviewExecute:
@@ -27,10 +28,12 @@ class ReviewExecute:
 @dataclass
 class ReviewExtractResults:
     results: str
+    task_id: str = ""
 
 @dataclass
 class ActionResults:
     results:str
+    request_id: str = ""
 
 @dataclass
 class ReasonerResults:
@@ -62,6 +65,8 @@ class ExecutorResults:
     code:str
     answer:str
     review: str
+    status: str = ""  # execution status of the final attempt, see modules.code_execution.ExecutionResult
+    exception_type: Optional[str] = None
 
 @dataclass
 class VerifierResults:
@@ -171,6 +176,9 @@ class ReasonerActionTask:
     task: str
     action: str
     question: str
+    request_id: str = ""
+    context: str = ""
+    actions: Optional[List[str]] = None  # set for batched scoring; otherwise `action` is the one action to score
 
 @dataclass
 class OutputTask:
@@ -198,7 +206,8 @@ class TaskContext:
     extractor_task: Optional[ExtractTask] = None
     executor_task: Optional[ExecuteTask] = None
     verify_task: Optional[VerifyTask] = None
-    
+    fingerprint: Optional[str] = None
+
     def add_task(self, task: Union[ReasonTask, ExtractTask, ExecuteTask, VerifyTask]) -> None:
         if isinstance(task, ReasonTask):
             self.reasoner_task = task
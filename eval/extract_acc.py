@@ -36,13 +36,21 @@ def normalize_number(value):
     except ValueError:
         return None
 
+def load_results(file_path):
+    """
+    Loads a result file written by FormateOutput, either CSV or Parquet.
+    """
+    if file_path.endswith('.parquet'):
+        return pd.read_parquet(file_path)
+    return pd.read_csv(file_path)
+
 def process_csv(file_path, answer_column, generated_text_column):
     """
     Reads a CSV file, validates required columns, and processes rows for number extraction.
     """
     try:
         # Read the file
-        df = pd.read_csv(file_path)
+        df = load_results(file_path)
 
         # Validate that required columns exist
         if answer_column not in df.columns or generated_text_column not in df.columns:
@@ -75,13 +83,13 @@ def process_csv(file_path, answer_column, generated_text_column):
 
 def process_directory(directory_path, answer_column, generated_text_column):
     """
-    Processes all CSV files in the specified directory.
+    Processes all CSV and Parquet result files in the specified directory.
     """
     all_results = []
     correct_rates = []
 
     for file_name in os.listdir(directory_path):
-        if file_name.endswith('.csv'):
+        if file_name.endswith(('.csv', '.parquet')):
             file_path = os.path.join(directory_path, file_name)
             print(f"Processing file: {file_name}")
             try:
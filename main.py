@@ -1,4 +1,5 @@
 import asyncio
+import copy
 import uuid
 import os
 import yaml
@@ -10,57 +11,23 @@ from agents.reasoner import ReasonerAgent
 from agents.executor import ExecutorAgent
 from agents.extractor import ExtractorAgent
 from agents.verifier import VerifierAgent
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from dataclass import TASK_CONTEXT_MAPPING, reasoner_topic_type, executor_topic_type, extractor_topic_type,verifier_topic_type, ReasonTask, TaskContext, output_topic_type
+from dataclass import TASK_CONTEXT_MAPPING, reasoner_topic_type, executor_topic_type, extractor_topic_type,verifier_topic_type, ReasonTask, TaskContext, TaskInput, output_topic_type
 import argparse
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from dataloader.parquet_dataset import ParquetDataset
 from dataloader.utils import dataset_to_task_inputs, inputs_to_contexts, load_and_prepare_dataset, load_finmath_dataset, finmath_to_taskinput
 from agents.formate_output import FormateOutput
-from typing import Any, List,Dict
-
-
-reason_client = OpenAIChatCompletionClient(
-    model="meta-llama/Meta-Llama-3-8B-Instruct",
-    base_url="http://localhost:8000/v1",
-    api_key="placeholder",
-    temperature=0.1,
-    top_p=0.9,
-    max_tokens=800,
-    model_capabilities={
-        "vision": False,
-        "function_calling": True,
-        "json_output": True,
-    },
-)
-
-extract_verify_client = OpenAIChatCompletionClient(
-    model="meta-llama/Meta-Llama-3-8B-Instruct", #"meta-llama/Llama-3.2-3B-Instruct"
-    base_url="http://localhost:8000/v1",
-    api_key="placeholder",
-    temperature=0.1,
-    top_p=0.9,
-    max_tokens=800,
-    model_capabilities={
-        "vision": False,
-        "function_calling": True,
-        "json_output": True,
-    },
-)
+from modules.result_writer import StreamingCSVWriter, ParquetResultWriter, create_result_writer, merge_shard_outputs, shard_file_path
+from modules.task_journal import TaskJournal, task_fingerprint
+from modules.llm_cache import ResponseCache, CachedChatCompletionClient
+from modules.prompt_budget import PromptBudgeter
+from modules.code_execution import InterpreterPool, CodeRunner
+from modules.endpoint_client import EndpointPool, agent_client_args
+from prompts import PROMPT_LAYOUTS
+from typing import Any, List, Dict, Optional
 
-execute_client = OpenAIChatCompletionClient(
-    model="meta-llama/CodeLlama-13b-Instruct-hf", #"meta-llama/Llama-3.2-1B-Instruct", "meta-llama/CodeLlama-7b-Instruct-hf"
-    base_url="http://localhost:8003/v1",
-    api_key="placeholder",
-    temperature=0.1,
-    top_p=0.9,
-    max_tokens=800,
-    model_capabilities={
-        "vision": False,
-        "function_calling": True,
-        "json_output": False,
-    },
-)
 
 AGENT_SEQUENCES = {
     "default": [
@@ -83,6 +50,13 @@ def parse_args():
     parser.add_argument("--finmath_data_path", type=str, default="data/financialmath/validation.json", help="Path to FinancialMath data.")
     parser.add_argument("--output_path", type=str, default="", help="Output path for task results.")
     parser.add_argument('--output_file', type=str, default="llama_outputs.csv", help="Name to the output CSV file")
+    parser.add_argument('--output_format', type=str, choices=["csv", "parquet"], default="csv", help="Format of the output file")
+    parser.add_argument('--flush_every', type=int, default=50, help="Number of finished tasks buffered before appending to the output file (row group size for parquet)")
+    parser.add_argument('--resume', action="store_true", help="Skip tasks already recorded as completed in the journal")
+    parser.add_argument('--journal_file', type=str, default=None, help="Completed-task journal file (defaults to <output_file>.journal)")
+    parser.add_argument('--runtime', type=str, choices=["single", "sharded"], default="single", help="single: one runtime in this process, sharded: tasks split across worker processes")
+    parser.add_argument('--num_workers', type=int, default=2, help="Worker processes in sharded mode. Each process has its own endpoint "
+                        "concurrency limiter, connection pool and interpreter pool; their configured sizes are divided among the workers")
     parser.add_argument('--temperature', type=float, default=0.3, help="Temperature for text generation")
     parser.add_argument('--top_n_chunk', type=int, default=4, help="Number of top chunks to use in the extractor")
     parser.add_argument('--rollout', type=int, default=20, help="Number of rollouts in reasoner")
@@ -93,53 +67,115 @@ async def register_agents(runtime: SingleThreadedAgentRuntime,
                           config: Dict[str, Any],
                           output_path: str,
                           output_file: str,
-                          top_n_chunk: int
+                          top_n_chunk: int,
+                          writer: StreamingCSVWriter | ParquetResultWriter,
+                          response_cache: Optional[ResponseCache] = None,
+                          code_runner: Optional[CodeRunner] = None,
+                          endpoints: Optional[EndpointPool] = None
                           ):
     """
     Registers agents with the runtime based on the agent sequence.
     """
     agents_to_register = [agent[0] for agent in AGENT_SEQUENCES[agent_sequence]]
+    endpoints = endpoints or EndpointPool(config.get("agents", {}).get("endpoint_defaults"))
+    client_args = {name: agent_client_args(config.get("agents", {}), name) for name in agents_to_register if name != "formate_output"}
+    prompt_layout = config.get("prompt_layout", "default")
+    if prompt_layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown prompt layout: {prompt_layout}")
+
+    def client_for(agent_name: str):
+        """
+        The agent's client on its shared endpoint. The response cache wraps the limiter, so hits take no slot.
+        """
+        agent_config = config.get("agents", {}).get(agent_name, {}) or {}
+        model_client = endpoints.create_client(
+            agent_name,
+            client_args[agent_name],
+            batching=agent_config.get("batching"),
+            tokenizer=agent_config.get("tokenizer")
+        )
+        if response_cache is None or not agent_config.get("cache", False):
+            return model_client
+        return CachedChatCompletionClient(model_client, response_cache, create_args=client_args[agent_name], name=agent_name)
+
+    def budgeter_for(agent_name: str, create_args: Dict[str, Any]) -> Optional[PromptBudgeter]:
+        agent_config = config.get("agents", {}).get(agent_name, {}) or {}
+        if not agent_config.get("max_prompt_tokens"):
+            return None
+        return PromptBudgeter(
+            name=agent_name,
+            max_prompt_tokens=agent_config["max_prompt_tokens"],
+            tokenizer=agent_config.get("tokenizer") or create_args["model"]
+        )
 
     if "reason_agent" in agents_to_register:
+        reason_model_client = client_for("reason_agent")
         await ReasonerAgent.register(
             runtime,
             type=reasoner_topic_type,
             factory=lambda: ReasonerAgent(
-                model_client=reason_client,
+                model_client=reason_model_client,
                 exploration_weight = config["reasoner"]["mcts"]["exploration_weight"],
                 weight_scheduler = config["reasoner"]["mcts"]["weight_scheduler"],
                 num_rollouts = config["reasoner"]["mcts"]["num_rollouts"],
                 discount = config["reasoner"]["mcts"]["discount"],
-                verbose = config["reasoner"]["mcts"]["verbose"]
+                verbose = config["reasoner"]["mcts"]["verbose"],
+                max_concurrent_rollouts = config["reasoner"]["mcts"].get("max_concurrent_rollouts", 1),
+                virtual_loss = config["reasoner"]["mcts"].get("virtual_loss", 1.0),
+                scoring_mode = config["reasoner"].get("scoring_mode", "single"),
+                prompt_budgeter = budgeter_for("reason_agent", client_args["reason_agent"])
            )
         )
 
     if "extract_agent" in agents_to_register:
+        extract_model_client = client_for("extract_agent")
         await ExtractorAgent.register(
             runtime,
             type=extractor_topic_type,
-            factory=lambda: ExtractorAgent(model_client=extract_verify_client, top_n_chunk=top_n_chunk)
+            factory=lambda: ExtractorAgent(
+                model_client=extract_model_client,
+                top_n_chunk=top_n_chunk,
+                bm25_cache_size=config.get("extractor", {}).get("bm25_cache_size", 128),
+                context_mode=config.get("extractor", {}).get("context_mode", "full"),
+                context_token_budget=config.get("extractor", {}).get("context_token_budget", 2048),
+                prompt_budgeter=budgeter_for("extract_agent", client_args["extract_agent"]),
+                prompt_layout=prompt_layout
+            )
         )
 
     if "executor_agent" in agents_to_register:
+        executor_model_client = client_for("executor_agent")
         await ExecutorAgent.register(
             runtime,
             type=executor_topic_type,
-            factory=lambda: ExecutorAgent(model_client=execute_client)
+            factory=lambda: ExecutorAgent(
+                model_client=executor_model_client,
+                prompt_budgeter=budgeter_for("executor_agent", client_args["executor_agent"]),
+                code_runner=code_runner,
+                num_candidates=config.get("executor", {}).get("num_candidates", 1),
+                candidate_temperature=config.get("executor", {}).get("candidate_temperature"),
+                prompt_layout=prompt_layout
+            )
         )
 
     if "verifier_agent" in agents_to_register:
+        verifier_model_client = client_for("verifier_agent")
         await VerifierAgent.register(
             runtime,
             type=verifier_topic_type,
-            factory=lambda: VerifierAgent(model_client=extract_verify_client)
+            factory=lambda: VerifierAgent(
+                model_client=verifier_model_client,
+                prompt_budgeter=budgeter_for("verifier_agent", client_args["verifier_agent"]),
+                prompt_layout=prompt_layout,
+                early_stop=config.get("verifier", {}).get("early_stop", False)
+            )
         )
 
     if "formate_output" in agents_to_register:
         await FormateOutput.register(
             runtime,
             type=output_topic_type,
-            factory=lambda: FormateOutput(output_path=output_path, output_file=output_file)
+            factory=lambda: FormateOutput(output_path=output_path, output_file=output_file, writer=writer)
         )
 
 async def publish_tasks(runtime: SingleThreadedAgentRuntime, task_contexts: List[TaskContext]):
@@ -164,37 +200,156 @@ async def publish_tasks(runtime: SingleThreadedAgentRuntime, task_contexts: List
         if isinstance(result, Exception):
             raise RuntimeError(f"Failed to publish task at index {idx}: {result}")
 
-async def main(args, config):
+def load_task_inputs(args) -> List[TaskInput]:
+    if args.dataset_name == "FinancialMath":
+        dataset = load_finmath_dataset(file_path= args.finmath_data_path, top_n=args.top_n)
+        return finmath_to_taskinput(dataset)
+    dataset = load_and_prepare_dataset(
+        data_path=args.data_path,
+        task_name=args.dataset_name,
+        top_n=args.top_n
+    )
+    return dataset_to_task_inputs(dataset=dataset)
+
+
+async def run_tasks(args, config: Dict[str, Any], task_contexts: List[TaskContext], output_file: str, journal: TaskJournal) -> None:
     """
-    The main asynchronous function to process all task contexts.
+    Runs task contexts to completion on one SingleThreadedAgentRuntime, writing results to output_file.
     """
-    agent_sequence = args.sequence
+    output_path = args.output_path
 
-    if args.rollout:
-        config["rollout"] = args.rollout
+    writer = create_result_writer(
+        file_path=os.path.join(output_path, output_file),
+        output_format=args.output_format,
+        flush_every=args.flush_every,
+        journal=journal
+    )
 
-    if args.dataset_name == "FinancialMath":
-        dataset = load_finmath_dataset(file_path= args.finmath_data_path, top_n=args.top_n)
-        task_inputs = finmath_to_taskinput(dataset)
-    else:
-        dataset = load_and_prepare_dataset(
-            data_path=args.data_path,
-            task_name=args.dataset_name,
-            top_n=args.top_n
+    response_cache = None
+    cache_config = config.get("llm_cache")
+    if cache_config:
+        response_cache = ResponseCache(
+            path=cache_config.get("path", "cache/llm_responses.sqlite"),
+            max_entries=cache_config.get("max_entries", 100000),
+            ttl_seconds=cache_config.get("ttl_seconds"),
         )
-        task_inputs = dataset_to_task_inputs(dataset=dataset)
 
-    output_file = args.output_file
-    output_path = args.output_path
-    top_n_chunk = args.top_n_chunk
+    executor_config = config.get("executor", {}) or {}
+    backend = executor_config.get("backend", "pool")
+    interpreter_pool = None
+    if backend == "pool":
+        interpreter_pool = InterpreterPool(
+            size=executor_config.get("pool_size", 4),
+            timeout=executor_config.get("timeout", 10),
+            memory_mb=executor_config.get("memory_mb", 1024),
+            cpu_seconds=executor_config.get("cpu_seconds", 10),
+            max_output_chars=executor_config.get("max_output_chars", 20000),
+        )
+    code_runner = CodeRunner(
+        backend=backend,
+        pool=interpreter_pool,
+        cache_size=executor_config.get("cache_size", 1024),
+        timeout=executor_config.get("timeout", 10),
+        fast_path=executor_config.get("fast_path", True),
+        max_output_chars=executor_config.get("max_output_chars", 20000),
+    )
 
-    task_contexts = inputs_to_contexts(task_inputs)
+    endpoints = EndpointPool(config.get("agents", {}).get("endpoint_defaults"))
 
     runtime = SingleThreadedAgentRuntime()
-    await register_agents(runtime=runtime, config=config, agent_sequence=agent_sequence, output_path=output_path, output_file=output_file, top_n_chunk=top_n_chunk)
+    await register_agents(runtime=runtime, config=config, agent_sequence=args.sequence, output_path=output_path, output_file=output_file, top_n_chunk=args.top_n_chunk, writer=writer, response_cache=response_cache, code_runner=code_runner, endpoints=endpoints)
     runtime.start()
     await publish_tasks(runtime, task_contexts)
     await runtime.stop_when_idle()
+    await writer.close()
+    logging.info(f"Code execution cache stats: {code_runner.stats()}")
+    await code_runner.close()
+    logging.info(f"Endpoint concurrency: {endpoints.stats()}")
+    logging.info(f"Shared prompt prefixes ({config.get('prompt_layout', 'default')} layout): {endpoints.prefix_stats()}")
+    await endpoints.close()
+
+    if response_cache is not None:
+        logging.info(f"LLM response cache stats: {response_cache.stats()}")
+        response_cache.close()
+
+
+def shard_config(config: Dict[str, Any], num_shards: int) -> Dict[str, Any]:
+    """
+    The config a shard process runs with: the per-endpoint concurrency limits, max_connections and the
+    interpreter pool size are divided among the shards, so the whole run stays within the configured totals.
+    """
+    config = copy.deepcopy(config)
+    defaults = config.get("agents", {}).get("endpoint_defaults") or {}
+    if "max_connections" in defaults:
+        defaults["max_connections"] = max(1, defaults["max_connections"] // num_shards)
+    concurrency = defaults.get("concurrency") or {}
+    min_limit = concurrency.get("min", 1)
+    for key in ("initial", "max"):
+        if key in concurrency:
+            concurrency[key] = max(min_limit, concurrency[key] // num_shards)
+    executor_config = config.get("executor") or {}
+    if "pool_size" in executor_config:
+        executor_config["pool_size"] = max(1, executor_config["pool_size"] // num_shards)
+    return config
+
+
+def run_shard(args, config: Dict[str, Any], shard_index: int, task_inputs: List[TaskInput], num_shards: int) -> None:
+    """
+    Entry point of a worker process in sharded mode: runs one shard of the tasks on its own runtime.
+    Results go to a per-shard output file, completed tasks to the shared journal.
+    """
+    task_contexts = inputs_to_contexts(task_inputs)
+    for task_context in task_contexts:
+        # Fingerprints use the run's config, not the per-shard one, so the journal matches across modes.
+        task_context.fingerprint = task_fingerprint(task_context.input_data, config)
+    journal = TaskJournal(file_path=journal_path(args))
+    logging.info(f"Shard {shard_index}: processing {len(task_contexts)} tasks.")
+    asyncio.run(run_tasks(args, shard_config(config, num_shards), task_contexts, shard_file_path(args.output_file, shard_index), journal))
+
+
+def journal_path(args) -> str:
+    return os.path.join(args.output_path, args.journal_file or f"{args.output_file}.journal")
+
+
+async def main(args, config):
+    """
+    The main asynchronous function to process all task contexts.
+    """
+    if args.rollout:
+        config["rollout"] = args.rollout
+
+    task_inputs = load_task_inputs(args)
+    task_contexts = inputs_to_contexts(task_inputs)
+    for task_context in task_contexts:
+        task_context.fingerprint = task_fingerprint(task_context.input_data, config)
+
+    output_file_path = os.path.join(args.output_path, args.output_file)
+    # Rows left in shard files by an interrupted sharded run are already journaled, fold them in first.
+    merge_shard_outputs(output_file_path, args.output_format)
+
+    journal = TaskJournal(file_path=journal_path(args))
+    if args.resume:
+        completed = journal.load()
+        task_contexts = [ctx for ctx in task_contexts if ctx.fingerprint not in completed]
+        logging.info(f"Resuming: {len(completed)} tasks already completed, {len(task_contexts)} remaining.")
+    else:
+        journal.reset()
+
+    if args.runtime == "single" or args.num_workers <= 1:
+        await run_tasks(args, config, task_contexts, args.output_file, journal)
+        return
+
+    # Each worker process runs the full agent pipeline on its own runtime for a slice of the tasks.
+    # Task state (TASK_CONTEXT_MAPPING) is process-local, so a task never leaves the process that started it.
+    num_workers = min(args.num_workers, len(task_contexts)) or 1
+    shards = [[ctx.input_data for ctx in task_contexts[i::num_workers]] for i in range(num_workers)]
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        await asyncio.gather(*(
+            loop.run_in_executor(pool, run_shard, args, config, shard_index, shard, num_workers)
+            for shard_index, shard in enumerate(shards)
+        ))
+    merge_shard_outputs(output_file_path, args.output_format)
 
 def load_config(config_path: str) -> Dict[str, Any]:
     """
@@ -3,6 +3,8 @@
 from .MCTS import MCTS_Searcher, MCTS_Node, verbose_print
 from typing import List, Callable,Awaitable
 from .reason_node import ReasoningNode
+from collections import defaultdict
+from typing import Dict
 import asyncio
 import random
 import logging
@@ -13,6 +15,8 @@ class MCTS_Searcher_Custom(MCTS_Searcher):
     """
     Custom MCTS Searcher tailored for ReasonerAgent and ReasoningNode.
     Handles per-action reward fetching via a callback provided by ReasonerAgent.
+    Up to `max_concurrent_tasks` rollouts run at once; nodes on an in-flight path carry a
+    virtual loss so that parallel rollouts spread over different branches.
     """
     def __init__(
         self,
@@ -23,6 +27,7 @@ class MCTS_Searcher_Custom(MCTS_Searcher):
         get_reward_func: Callable[[str], Awaitable[float]] = None,
         verbose: bool = False,
         max_concurrent_tasks: int = 1,
+        virtual_loss: float = 1.0,
     ):
         super().__init__(
             exploration_weight=exploration_weight,
@@ -33,6 +38,8 @@ class MCTS_Searcher_Custom(MCTS_Searcher):
         )
         self.get_reward_func = get_reward_func
         self.semaphore = asyncio.Semaphore(max_concurrent_tasks)
+        self.virtual_loss = virtual_loss
+        self.in_flight: Dict[MCTS_Node, int] = defaultdict(int)  # rollouts currently passing through each node
 
     async def run_rollouts(self, root_node: ReasoningNode) -> List[str]:
         """
@@ -82,14 +89,41 @@ class MCTS_Searcher_Custom(MCTS_Searcher):
         async with self.semaphore:
             verbose_print("==> Selecting a node...", self.verbose)
             path = await self._select(root_node, rollout_id)
-            leaf = path[-1]
-            verbose_print(f"==> Expanding node {leaf.id}...", self.verbose)
-            await self._expand(leaf, rollout_id)
-            verbose_print(f"==> Simulating node {leaf.id}...", self.verbose)
-            simulation_path = await self._simulate(leaf, rollout_id)
+            self._add_virtual_loss(path)
+            try:
+                leaf = path[-1]
+                verbose_print(f"==> Expanding node {leaf.id}...", self.verbose)
+                await self._expand(leaf, rollout_id)
+                verbose_print(f"==> Simulating node {leaf.id}...", self.verbose)
+                simulation_path = await self._simulate(leaf, rollout_id)
+            finally:
+                self._revert_virtual_loss(path)
             verbose_print(f"==> Backpropagating...", self.verbose)
             await self._backpropagate(path + simulation_path)
 
+    def _add_virtual_loss(self, path: List[MCTS_Node]) -> None:
+        """
+        Count an in-flight rollout as a visit with zero reward, lowering the UCT value of its path.
+        """
+        for node in path:
+            self.N[node] += self.virtual_loss
+            self.in_flight[node] += 1
+
+    def _revert_virtual_loss(self, path: List[MCTS_Node]) -> None:
+        for node in path:
+            self.N[node] -= self.virtual_loss
+            self.in_flight[node] -= 1
+            if self.in_flight[node] == 0:
+                del self.in_flight[node]
+
+    async def _expand(self, node: MCTS_Node, rollout_id: int):
+        """
+        Expand `node` once; a concurrent rollout that reaches the same leaf keeps the existing children.
+        """
+        if node in self.parent2children:
+            return
+        await super()._expand(node, rollout_id)
+
     async def _simulate(self, node: 'ReasoningNode', rollout_id: int) -> List['ReasoningNode']:
         """
         Simulate a rollout from the given node to obtain a list of nodes with accumulated rewards.
@@ -104,12 +138,11 @@ class MCTS_Searcher_Custom(MCTS_Searcher):
             action = random.choice(possible_actions)
             # Asynchronously get the reward for the action
             score = await self.get_reward_func(action)
-            current_node.state['action_rewards'].append(score)
-            # Move to the next state
+            # Move to the next state; the leaf may be shared with concurrent rollouts, so it is not mutated
             new_state = {
                 'actions_taken': current_node.state['actions_taken'] + [action],
                 'current_action_index': current_node.state['current_action_index'] + 1,
-                'action_rewards': current_node.state['action_rewards'].copy(),
+                'action_rewards': current_node.state['action_rewards'] + [score],
                 'possible_actions': [a for a in possible_actions if a != action]
             }
             child_node = ReasoningNode(state=new_state, parent=current_node, action=action)
@@ -146,7 +179,9 @@ class MCTS_Searcher_Custom(MCTS_Searcher):
 
             unexplored = [n for n in self.parent2children[node] if n not in self.explored_nodes]
             if unexplored:
-                n = random.choice(unexplored)
+                # Prefer children that no other rollout is currently simulating.
+                idle = [n for n in unexplored if n not in self.in_flight]
+                n = random.choice(idle or unexplored)
                 path.append(n)
                 return path
 
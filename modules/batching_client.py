@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncGenerator, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import httpx
+from autogen_core.models import (
+    AssistantMessage,
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    RequestUsage,
+    SystemMessage,
+    UserMessage,
+)
+
+from .prompt_budget import estimate_tokens, load_local_tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Client arguments that are sampling parameters of a completions request. Requests are only
+# batched together when all of them (plus any extra_create_args) are equal, except the seed.
+SAMPLING_ARG_KEYS = ("temperature", "top_p", "max_tokens", "seed", "stop", "frequency_penalty", "presence_penalty")
+FINISH_REASONS = ("stop", "length")
+
+ChatRenderer = Callable[[List[Dict[str, str]]], str]
+
+
+def to_chat_messages(messages: Sequence[LLMMessage]) -> Optional[List[Dict[str, str]]]:
+    """
+    Convert autogen messages to chat template messages. Returns None for anything but plain text
+    system/user/assistant messages, which cannot be rendered locally.
+    """
+    chat_messages = []
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            role = "system"
+        elif isinstance(message, UserMessage):
+            role = "user"
+        elif isinstance(message, AssistantMessage):
+            role = "assistant"
+        else:
+            return None
+        if not isinstance(message.content, str):
+            return None
+        chat_messages.append({"role": role, "content": message.content})
+    return chat_messages
+
+
+class BatchingCompletionClient:
+    def __init__(
+            self,
+            model_client: ChatCompletionClient,
+            client_args: Mapping[str, Any],
+            http_client: Optional[httpx.AsyncClient] = None,
+            render_prompt: Optional[ChatRenderer] = None,
+            tokenizer: Optional[str] = None,
+            batch_window: float = 0.01,
+            max_batch_size: int = 32,
+            name: str = ""
+    ) -> None:
+        """
+        Coalesces `create` calls that arrive within `batch_window` seconds and share the same sampling
+        parameters into one multi-prompt /completions request. Prompts are rendered locally with the served
+        model's chat template (`render_prompt`, or the tokenizer loaded from the local Hugging Face cache),
+        which already contains the BOS token, so the server is told not to add special tokens again.
+        A cancelled caller drops out of its batch; the request still completes for the others.
+        The seed is not part of the batching key, so calls that differ only in their seed (e.g. executor
+        candidates) share a batch. vLLM applies one seed to every prompt of a request, so a batch with
+        mixed seeds is sent without one and each prompt is sampled independently.
+        Calls with tools or json_output, messages that cannot be rendered, or a missing chat template
+        go to the wrapped chat client unchanged, as do all other attributes.
+        """
+        self._model_client = model_client
+        self.model = client_args["model"]
+        self.url = client_args["base_url"].rstrip("/") + "/completions"
+        self.create_args = {key: client_args[key] for key in SAMPLING_ARG_KEYS if key in client_args}
+        self._headers = {"Authorization": f"Bearer {client_args.get('api_key', '')}"}
+        self._owns_http_client = http_client is None
+        self._http_client = http_client or httpx.AsyncClient(timeout=httpx.Timeout(600, connect=5.0))
+        self.batch_window = batch_window
+        self.max_batch_size = max(1, max_batch_size)
+        self.name = name
+
+        self._tokenizer = None
+        if render_prompt is None:
+            self._tokenizer = load_local_tokenizer(tokenizer or self.model, owner=name)
+            if self._tokenizer is not None and getattr(self._tokenizer, "chat_template", None):
+                render_prompt = self._render_with_tokenizer
+            else:
+                logger.warning(f"[{name}] No chat template available, requests will not be batched.")
+        self._render_prompt = render_prompt
+
+        self._pending: Dict[str, Tuple[Dict[str, Any], List[Tuple[str, Any, asyncio.Future]]]] = {}  # key -> (sampling, [(prompt, seed, future)])
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._in_flight: set = set()
+        self.batches = 0
+        self.batched_requests = 0
+        self.fallbacks = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._model_client, name)
+
+    def create_stream(self, messages: Sequence[LLMMessage], **kwargs: Any) -> AsyncGenerator[Union[str, CreateResult], None]:
+        """
+        Streams are not batched, they go to the chat client.
+        """
+        self.fallbacks += 1
+        return self._model_client.create_stream(messages, **kwargs)
+
+    def _render_with_tokenizer(self, chat_messages: List[Dict[str, str]]) -> str:
+        return self._tokenizer.apply_chat_template(chat_messages, tokenize=False, add_generation_prompt=True)
+
+    def _render(self, messages: Sequence[LLMMessage]) -> Optional[str]:
+        if self._render_prompt is None:
+            return None
+        chat_messages = to_chat_messages(messages)
+        if chat_messages is None:
+            return None
+        try:
+            return self._render_prompt(chat_messages)
+        except Exception as e:
+            logger.warning(f"[{self.name}] Could not render chat template ({e}), sending as a chat request.")
+            return None
+
+    def _count_tokens(self, text: str) -> int:
+        if self._tokenizer is None:
+            return estimate_tokens(text)
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+    async def create(self, messages: Sequence[LLMMessage], **kwargs: Any) -> CreateResult:
+        prompt = None
+        if not kwargs.get("tools") and not kwargs.get("json_output"):
+            prompt = self._render(messages)
+        if prompt is None:
+            self.fallbacks += 1
+            return await self._model_client.create(messages, **kwargs)
+
+        sampling = {**self.create_args, **(kwargs.get("extra_create_args") or {})}
+        seed = sampling.pop("seed", None)
+        key = json.dumps(sampling, sort_keys=True, default=str)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if kwargs.get("cancellation_token") is not None:
+            kwargs["cancellation_token"].link_future(future)
+        _, batch = self._pending.setdefault(key, (sampling, []))
+        batch.append((prompt, seed, future))
+        if len(batch) >= self.max_batch_size:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self.batch_window, self._flush, key)
+        return await future
+
+    def _flush(self, key: str) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if key not in self._pending:
+            return
+        sampling, batch = self._pending.pop(key)
+        task = asyncio.ensure_future(self._send(sampling, batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, sampling: Dict[str, Any], batch: List[Tuple[str, Any, asyncio.Future]]) -> None:
+        """
+        Send one /completions request for the whole batch and resolve each caller's future with its choice.
+        """
+        batch = [(prompt, seed, future) for prompt, seed, future in batch if not future.done()]
+        if not batch:
+            return
+        self.batches += 1
+        self.batched_requests += len(batch)
+        body = {**sampling, "model": self.model, "prompt": [prompt for prompt, _, _ in batch], "add_special_tokens": False}
+        seeds = {seed for _, seed, _ in batch}
+        if len(seeds) == 1 and None not in seeds:
+            body["seed"] = seeds.pop()
+        try:
+            response = await self._http_client.post(self.url, json=body, headers=self._headers)
+            response.raise_for_status()
+            choices = {choice["index"]: choice for choice in response.json()["choices"]}
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for index, (prompt, _, future) in enumerate(batch):
+            if future.done():  # the caller was cancelled
+                continue
+            choice = choices.get(index)
+            if choice is None:
+                future.set_exception(RuntimeError(f"[{self.name}] Batched completion is missing choice {index}."))
+                continue
+            text = choice.get("text") or ""
+            finish_reason = choice.get("finish_reason")
+            future.set_result(CreateResult(
+                finish_reason=finish_reason if finish_reason in FINISH_REASONS else "unknown",
+                content=text,
+                # The server reports usage for the whole batch, so per-call usage is counted locally.
+                usage=RequestUsage(prompt_tokens=self._count_tokens(prompt), completion_tokens=self._count_tokens(text)),
+                cached=False,
+            ))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "batches": self.batches,
+            "batched_requests": self.batched_requests,
+            "mean_batch_size": self.batched_requests / self.batches if self.batches else 0.0,
+            "fallbacks": self.fallbacks,
+        }
+
+    async def close(self) -> None:
+        for key in list(self._pending):
+            self._flush(key)
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._owns_http_client:
+            await self._http_client.aclose()
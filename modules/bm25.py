@@ -1,8 +1,75 @@
-from typing import Any, Dict, List, Tuple, Union
-from rank_bm25 import BM25Okapi
+from typing import Any, Callable, Dict, List, Tuple, Union
+from collections import Counter, OrderedDict
+import hashlib
+import numpy as np
+from scipy.sparse import csr_matrix
 import re
 import logging
 
+
+class SparseBM25:
+    def __init__(self, corpus: List[List[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25) -> None:
+        """
+        Okapi BM25 over a sparse document-term matrix. Scores match rank_bm25.BM25Okapi,
+        but a query is scored with a single sparse mat-vec instead of a Python loop per term.
+        """
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.corpus_size = len(corpus)
+        self.vocab: Dict[str, int] = {}
+
+        rows, cols, counts = [], [], []
+        doc_len = np.zeros(self.corpus_size, dtype=np.float64)
+        for i, document in enumerate(corpus):
+            doc_len[i] = len(document)
+            for term, tf in Counter(document).items():
+                rows.append(i)
+                cols.append(self.vocab.setdefault(term, len(self.vocab)))
+                counts.append(tf)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        tf = np.asarray(counts, dtype=np.float64)
+        vocab_size = len(self.vocab)
+
+        # Inverse document frequency; negative values are floored to epsilon * average idf, as in BM25Okapi.
+        df = np.bincount(cols, minlength=vocab_size).astype(np.float64)
+        idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+        average_idf = idf.sum() / vocab_size if vocab_size else 0.0
+        idf[idf < 0] = self.epsilon * average_idf
+        self.idf = idf
+
+        avgdl = doc_len.sum() / self.corpus_size if self.corpus_size else 0.0
+        length_norm = self.k1 * (1 - self.b + self.b * doc_len / (avgdl or 1.0))
+        weights = idf[cols] * tf * (self.k1 + 1) / (tf + length_norm[rows])
+        self.doc_term_weights = csr_matrix((weights, (rows, cols)), shape=(self.corpus_size, vocab_size))
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        """
+        BM25 score of every document for the tokenized query. Repeated query terms count repeatedly.
+        """
+        query_vector = np.zeros(len(self.vocab), dtype=np.float64)
+        for term in query:
+            j = self.vocab.get(term)
+            if j is not None:
+                query_vector[j] += 1
+        return self.doc_term_weights @ query_vector
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Indices of the k best scores in descending order, ties broken by document order.
+        """
+        n = scores.shape[0]
+        if k >= n:
+            return np.argsort(-scores, kind="stable")
+        kth_score = -np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(scores > kth_score)
+        tied = np.flatnonzero(scores == kth_score)[: k - above.size]
+        candidates = np.concatenate([above, tied])
+        return candidates[np.lexsort((candidates, -scores[candidates]))]
+
 class BM25Model:
     def __init__(self, model_name: str, top_k: int = 4, **kwargs: Any) -> None:
         """
@@ -12,6 +79,13 @@ class BM25Model:
         self._chunks = []
         self.top_k = top_k
         self.max_chunk_size = kwargs.get("max_chunk_size", 500)
+        # Tables are never split by sentence, so a selected table chunk is always complete.
+        self.keep_tables_whole = kwargs.get("keep_tables_whole", False)
+        # LRU of built indexes keyed by a hash of the passage; 0 disables caching.
+        self.cache_size = kwargs.get("cache_size", 128)
+        self._index_cache: "OrderedDict[str, Tuple[List[str], SparseBM25]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def get_top_chunks(self, query: str, passage: str, top_k: int = None) -> List[Dict[str, Union[str, float]]]:
         """
@@ -22,8 +96,7 @@ class BM25Model:
         if not isinstance(passage, str) or passage.strip() == "":
             passage = query.lower()
 
-        self._chunks = self.chunk_mixed_content(passage)
-        self._setup_bm25_index(self._chunks)
+        self._load_index(passage)
 
         # Use the top_k parameter if provided; otherwise, use the class-level setting.
         top_k = top_k or self.top_k
@@ -32,12 +105,66 @@ class BM25Model:
 
         return self._format_top_chunks(top_chunks)
 
+    def get_chunks_within_budget(self, query: str, passage: str, max_tokens: int, count_tokens: Callable[[str], int]) -> List[Dict[str, Union[str, float]]]:
+        """
+        Greedily select the highest-scoring chunks whose total size fits within `max_tokens`.
+        The selected chunks are returned in document order.
+        """
+        if not isinstance(query, str):
+            raise ValueError(f"Query should be a string, but got {type(query).__name__}. Content: {query}")
+        if not isinstance(passage, str) or passage.strip() == "":
+            passage = query.lower()
+
+        self._load_index(passage)
+        scores = self._bm25.get_scores(self._tokenize(query))
+
+        selected = []
+        used_tokens = 0
+        for i in SparseBM25.top_k(scores, len(self._chunks)):
+            cost = count_tokens(self._chunks[i])
+            if used_tokens + cost > max_tokens:
+                continue  # a smaller, lower-ranked chunk may still fit
+            selected.append(i)
+            used_tokens += cost
+
+        return self._format_top_chunks([(self._chunks[i], float(scores[i])) for i in sorted(selected)])
+
+    def _load_index(self, passage: str) -> None:
+        """
+        Reuse the chunks and index of a previously seen passage, or build and cache them.
+        """
+        key = hashlib.sha1(passage.encode("utf-8")).hexdigest()
+        cached = self._index_cache.get(key)
+        if cached is not None:
+            self._index_cache.move_to_end(key)
+            self.cache_hits += 1
+            self._chunks, self._bm25 = cached
+            return
+
+        self.cache_misses += 1
+        self._chunks = self.chunk_mixed_content(passage)
+        self._setup_bm25_index(self._chunks)
+        if self.cache_size > 0:
+            self._index_cache[key] = (self._chunks, self._bm25)
+            if len(self._index_cache) > self.cache_size:
+                self._index_cache.popitem(last=False)
+
+    def cache_info(self) -> Dict[str, Union[int, float]]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "size": len(self._index_cache),
+            "max_size": self.cache_size,
+        }
+
     def _setup_bm25_index(self, chunks: List[str]) -> None:
         """
         Set up the BM25 model with the given chunks.
         """
         tokenized_chunks = [self._tokenize(chunk) for chunk in chunks]
-        self._bm25 = BM25Okapi(tokenized_chunks)
+        self._bm25 = SparseBM25(tokenized_chunks)
 
     def _search_bm25(self, query: str, top_k: int) -> List[Tuple[str, float]]:
         """
@@ -46,13 +173,9 @@ class BM25Model:
         tokenized_query = self._tokenize(query)
         scores = self._bm25.get_scores(tokenized_query)
 
-        # Combine scores with chunks and sort by relevance
-        ranked_chunks = sorted(
-            zip(self._chunks, scores),
-            key=lambda x: x[1],
-            reverse=True
-        )
-        return ranked_chunks[:top_k]  # Return the specified number of top chunks
+        # Select the top_k chunks without sorting the whole corpus
+        top_indices = SparseBM25.top_k(scores, top_k)
+        return [(self._chunks[i], float(scores[i])) for i in top_indices]
 
     def _tokenize(self, text: str) -> List[str]:
         """
@@ -127,7 +250,9 @@ class BM25Model:
 
         final_chunks = []
         for chunk in chunks:
-            if len(chunk) > max_chunk_size:
+            if self.keep_tables_whole and chunk.startswith("|"):
+                final_chunks.append(chunk)
+            elif len(chunk) > max_chunk_size:
                 sentences = re.split(r'(?<=[.?!])\s+', chunk)  # Split by sentence boundary
                 temp_chunk = []
                 current_size = 0
@@ -0,0 +1,564 @@
+import ast
+import asyncio
+import builtins
+import hashlib
+import io
+import json
+import logging
+import operator
+import os
+import re
+import sys
+import tempfile
+import textwrap
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .interpreter_worker import truncate
+
+logger = logging.getLogger(__name__)
+
+WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "interpreter_worker.py")
+# Same fenced-block pattern as autogen's code extraction.
+CODE_BLOCK_PATTERN = r"```[ \t]*(\w+)?[ \t]*\r?\n(.*?)\r?\n[ \t]*```"
+PYTHON_LANGUAGES = ("", "python", "py", "python3")
+BACKENDS = ("pool", "subprocess", "inprocess")
+EXCEPTION_LINE_PATTERN = r"^(\w+(?:Error|Exception|Exit|Interrupt))\b"
+# Deterministic outcomes only; timeouts and crashes may not repeat.
+CACHEABLE_STATUSES = ("ok", "error")
+# Tries to respawn a pool worker, with exponential backoff from SPAWN_BACKOFF seconds.
+SPAWN_ATTEMPTS = 3
+SPAWN_BACKOFF = 0.5
+
+
+@dataclass
+class ExecutionResult:
+    status: str  # "ok", "error", "syntax_error", "timeout", "crashed" or "no_code"
+    stdout: str = ""
+    stderr: str = ""
+    duration: float = 0.0
+    exception_type: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+    def to_text(self) -> str:
+        """
+        Render the result for prompts, in the format of the previous command-line executor.
+        """
+        if self.status == "no_code":
+            return "No Python code block found in the response."
+        if self.ok:
+            return f"exitcode: 0 (execution succeeded)\nCode output: {self.stdout}"
+        return f"exitcode: 1 (execution failed: {self.status})\nCode output: {self.stdout}{self.stderr}"
+
+
+def extract_code_blocks(text: str) -> List[str]:
+    """
+    Python code blocks of an LLM response. A response without fences is treated as code.
+    """
+    matches = re.findall(CODE_BLOCK_PATTERN, text, flags=re.DOTALL)
+    if not matches:
+        return [text] if text.strip() else []
+    return [code for language, code in matches if (language or "").lower() in PYTHON_LANGUAGES]
+
+
+def preflight(response: str) -> Tuple[str, Optional[ExecutionResult]]:
+    """
+    Extract the code of a response and compile it. Returns the code and, when it cannot run,
+    the failed result to report instead of executing it.
+    """
+    start = time.perf_counter()
+    code_blocks = extract_code_blocks(response)
+    if not code_blocks:
+        return "", ExecutionResult(status="no_code")
+    code = textwrap.dedent("\n".join(code_blocks))
+    try:
+        compile(code, "<snippet>", "exec")
+    except (SyntaxError, ValueError) as e:
+        return code, ExecutionResult(
+            status="syntax_error", stderr="".join(traceback.format_exception_only(type(e), e)),
+            duration=time.perf_counter() - start, exception_type=type(e).__name__
+        )
+    return code, None
+
+
+def normalize_code(code: str) -> str:
+    """
+    Canonical form of a snippet for caching: comments, blank lines and formatting are ignored when the code parses.
+    """
+    code = textwrap.dedent(code.replace("\r\n", "\n"))
+    try:
+        return ast.unparse(ast.parse(code))
+    except SyntaxError:
+        return "\n".join(line.rstrip() for line in code.splitlines() if line.strip())
+
+
+def execute_in_process(code: str, max_output_chars: int = 0) -> ExecutionResult:
+    """
+    Execute code in this process with an isolated global namespace. Safe to call from many threads at once:
+    output is captured by a per-call print bound into the snippet's builtins, sys.stdout is never reassigned.
+    Writes that bypass print (sys.stdout.write) are not captured.
+    """
+    buffer = io.StringIO()
+
+    def captured_print(*args, sep=" ", end="\n", file=None, flush=False):
+        if file is None or file is sys.stdout:
+            file = buffer
+        builtins.print(*args, sep=sep, end=end, file=file, flush=flush)
+
+    namespace = {"__builtins__": {**vars(builtins), "print": captured_print}, "__name__": "__main__"}
+    status, exception_type, stderr = "ok", None, ""
+    start = time.perf_counter()
+    try:
+        exec(textwrap.dedent(code).lstrip(), namespace)
+    except Exception as e:
+        status, exception_type, stderr = "error", type(e).__name__, traceback.format_exc()
+    return ExecutionResult(
+        status=status, stdout=truncate(buffer.getvalue(), max_output_chars), stderr=truncate(stderr, max_output_chars),
+        duration=time.perf_counter() - start, exception_type=exception_type
+    )
+
+
+BINARY_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+}
+UNARY_OPERATORS: Dict[type, Callable[[Any], Any]] = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+FAST_PATH_FUNCTIONS: Dict[str, Callable[..., Any]] = {"round": round, "abs": abs, "min": min, "max": max}
+MAX_EXPONENT = 100
+# Largest operand or result the fast path computes on the event loop. Financial values are far below this;
+# anything larger (e.g. chained powers) goes to the sandboxed backend with its timeout and rlimits.
+MAX_INT_BITS = 1024
+MAX_FLOAT_MAGNITUDE = 1e300
+# Largest width or precision of an f-string format spec the fast path formats, e.g. f"{x:>12,.2f}".
+MAX_FORMAT_WIDTH = 100
+# [[fill]align][sign][z][#][0][width][grouping][.precision][type], capturing width and precision.
+FORMAT_SPEC_PATTERN = r"(?:.?[<>=^])?[+\- ]?z?#?0?(\d*)[,_]?(?:\.(\d+))?[a-zA-Z%]?"
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _check_magnitude(value: Any) -> None:
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise _Unsupported("large integer")
+    if isinstance(value, float) and abs(value) > MAX_FLOAT_MAGNITUDE:
+        raise _Unsupported("large float")
+
+
+def _check_format_spec(spec: str) -> None:
+    match = re.fullmatch(FORMAT_SPEC_PATTERN, spec, flags=re.DOTALL)
+    if match is None:
+        raise _Unsupported("format spec")
+    if any(int(number or 0) > MAX_FORMAT_WIDTH for number in match.groups()):
+        raise _Unsupported("large format width")
+
+
+class ArithmeticEvaluator:
+    """
+    Interprets straight-line arithmetic programs directly from the AST: numeric assignments, arithmetic
+    operators, round/abs/min/max and print. Any other node rejects the whole program.
+    """
+    def __init__(self) -> None:
+        self.names: Dict[str, Any] = {}
+        self.output = io.StringIO()
+
+    def run(self, tree: ast.Module) -> None:
+        for statement in tree.body:
+            self.statement(statement)
+
+    def statement(self, node: ast.stmt) -> None:
+        if isinstance(node, ast.Assign):
+            value = self.expression(node.value)
+            for target in node.targets:
+                self.assign(target, value)
+        elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+            current = self.expression(ast.Name(id=node.target.id, ctx=ast.Load()))
+            self.names[node.target.id] = self.binary(type(node.op), current, self.expression(node.value))
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+            self.call(node.value)
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
+            pass  # docstrings and bare literals
+        else:
+            raise _Unsupported(type(node).__name__)
+
+    def assign(self, target: ast.expr, value: Any) -> None:
+        if isinstance(target, ast.Name):
+            self.names[target.id] = value
+        elif isinstance(target, (ast.Tuple, ast.List)) and isinstance(value, (tuple, list)) and len(target.elts) == len(value):
+            for element, item in zip(target.elts, value):
+                self.assign(element, item)
+        else:
+            raise _Unsupported(type(target).__name__)
+
+    def binary(self, op: type, left: Any, right: Any) -> Any:
+        if op not in BINARY_OPERATORS:
+            raise _Unsupported(op.__name__)
+        if not all(isinstance(v, (int, float)) for v in (left, right)):
+            raise _Unsupported("non-numeric operand")  # e.g. str * int
+        _check_magnitude(left)
+        _check_magnitude(right)
+        if op is ast.Pow:
+            if abs(right) > MAX_EXPONENT:
+                raise _Unsupported("large exponent")
+            # Estimate the result size before computing it: |base|**e has about bits(base) * e bits.
+            if isinstance(left, int) and left.bit_length() * abs(right) > MAX_INT_BITS:
+                raise _Unsupported("large power")
+        result = BINARY_OPERATORS[op](left, right)
+        if op in (ast.Mult, ast.Pow):
+            _check_magnitude(result)
+        return result
+
+    def expression(self, node: ast.expr) -> Any:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+            return node.value
+        if isinstance(node, ast.Name) and node.id in self.names:
+            return self.names[node.id]
+        if isinstance(node, ast.BinOp):
+            return self.binary(type(node.op), self.expression(node.left), self.expression(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+            operand = self.expression(node.operand)
+            if not isinstance(operand, (int, float)):
+                raise _Unsupported("non-numeric operand")
+            return UNARY_OPERATORS[type(node.op)](operand)
+        if isinstance(node, ast.Tuple):
+            return tuple(self.expression(element) for element in node.elts)
+        if isinstance(node, ast.List):
+            return [self.expression(element) for element in node.elts]
+        if isinstance(node, ast.Call):
+            return self.call(node)
+        if isinstance(node, ast.JoinedStr):
+            return "".join(self.expression(value) for value in node.values)
+        if isinstance(node, ast.FormattedValue) and node.conversion == -1:
+            spec = self.expression(node.format_spec) if node.format_spec is not None else ""
+            _check_format_spec(spec)
+            return format(self.expression(node.value), spec)
+        raise _Unsupported(type(node).__name__)
+
+    def call(self, node: ast.Call) -> Any:
+        if not isinstance(node.func, ast.Name) or any(isinstance(arg, ast.Starred) for arg in node.args):
+            raise _Unsupported("call")
+        args = [self.expression(arg) for arg in node.args]
+        if node.func.id == "print":
+            kwargs = {k.arg: self.expression(k.value) for k in node.keywords}
+            if not set(kwargs) <= {"sep", "end"}:
+                raise _Unsupported("print keyword")
+            print(*args, **kwargs, file=self.output)
+            return None
+        if node.func.id not in FAST_PATH_FUNCTIONS or node.keywords:
+            raise _Unsupported(node.func.id)
+        return FAST_PATH_FUNCTIONS[node.func.id](*args)
+
+
+def evaluate_arithmetic(code: str, max_output_chars: int = 0) -> Optional[ExecutionResult]:
+    """
+    Fast path for pure arithmetic snippets. Returns None when the program uses anything outside the
+    whitelist or fails, so that it runs on the sandboxed backend instead. Output is truncated to
+    max_output_chars like the backends' output.
+    """
+    start = time.perf_counter()
+    try:
+        tree = ast.parse(textwrap.dedent(code))
+        evaluator = ArithmeticEvaluator()
+        evaluator.run(tree)
+    except (_Unsupported, SyntaxError, ArithmeticError, TypeError, ValueError, RecursionError):
+        return None
+    stdout = truncate(evaluator.output.getvalue(), max_output_chars)
+    return ExecutionResult(status="ok", stdout=stdout, duration=time.perf_counter() - start)
+
+
+async def _read_capped(stream: asyncio.StreamReader, max_bytes: int) -> bytes:
+    """
+    Read a stream to EOF, keeping the first max_bytes and discarding the rest so the child never blocks on a full pipe.
+    """
+    kept = bytearray()
+    dropped = 0
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        room = max_bytes - len(kept)
+        kept += chunk[:max(room, 0)]
+        dropped += max(len(chunk) - max(room, 0), 0)
+    if dropped:
+        kept += f"\n...[{dropped} bytes truncated]".encode("utf-8")
+    return bytes(kept)
+
+
+async def execute_subprocess(code: str, timeout: float = 10, max_output_chars: int = 20000) -> ExecutionResult:
+    """
+    Run code in a fresh isolated interpreter (python -I) in a temporary directory, fed through stdin.
+    """
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="snippet_") as workdir:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-I", "-",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=workdir,
+        )
+
+        async def communicate():
+            process.stdin.write(code.encode("utf-8"))
+            process.stdin.close()
+            return await asyncio.gather(
+                _read_capped(process.stdout, max_output_chars),
+                _read_capped(process.stderr, max_output_chars),
+                process.wait(),
+            )
+
+        try:
+            stdout, stderr, returncode = await asyncio.wait_for(communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return ExecutionResult(status="timeout", stderr=f"Execution timed out after {timeout} seconds.", duration=timeout)
+
+    stderr_text = stderr.decode("utf-8", errors="replace")
+    exception_type = None
+    if returncode != 0:
+        matches = re.findall(EXCEPTION_LINE_PATTERN, stderr_text, flags=re.MULTILINE)
+        exception_type = matches[-1] if matches else None
+    return ExecutionResult(
+        status="ok" if returncode == 0 else ("error" if returncode > 0 else "crashed"),
+        stdout=stdout.decode("utf-8", errors="replace"),
+        stderr=stderr_text,
+        duration=time.perf_counter() - start,
+        exception_type=exception_type,
+    )
+
+
+class _Worker:
+    def __init__(self, process: asyncio.subprocess.Process, workdir: tempfile.TemporaryDirectory) -> None:
+        self.process = process
+        self.workdir = workdir
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def request(self, payload: dict) -> dict:
+        self.process.stdin.write((json.dumps(payload) + "\n").encode("utf-8"))
+        await self.process.stdin.drain()
+        line = await self.process.stdout.readline()
+        if not line:
+            raise ConnectionError(f"worker exited with code {await self.process.wait()}")
+        return json.loads(line)
+
+    async def kill(self) -> None:
+        if self.alive:
+            self.process.kill()
+            await self.process.wait()
+        self.workdir.cleanup()
+
+
+class InterpreterPool:
+    def __init__(
+            self,
+            size: int = 4,
+            timeout: float = 10,
+            memory_mb: int = 1024,
+            cpu_seconds: float = 10,
+            max_output_chars: int = 20000
+    ) -> None:
+        """
+        Pool of warm Python worker processes with math, numpy and pandas preloaded.
+        Snippets are sent over a pipe and run under a wall-clock timeout plus memory and CPU rlimits.
+        Workers that time out, crash or are abandoned by a cancelled caller are killed and replaced in the
+        background. A worker that cannot be respawned after SPAWN_ATTEMPTS tries shrinks the pool; once no
+        workers are left, execute fails fast instead of waiting.
+        """
+        self.size = size
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.max_output_chars = max_output_chars
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: Set[_Worker] = set()
+        self._replacements: Set[asyncio.Task] = set()
+        self._start_lock = asyncio.Lock()
+        self._capacity = 0
+        self.restarts = 0
+
+    async def _spawn(self) -> _Worker:
+        workdir = tempfile.TemporaryDirectory(prefix="interpreter_")
+        # One BLAS thread per worker, the pool provides the parallelism and RLIMIT_AS stays meaningful.
+        env = {**os.environ, "OMP_NUM_THREADS": "1", "OPENBLAS_NUM_THREADS": "1", "MKL_NUM_THREADS": "1"}
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, WORKER_PATH, str(self.memory_mb),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=workdir.name,
+            env=env,
+            limit=4 * self.max_output_chars + 65536,
+        )
+        worker = _Worker(process, workdir)
+        ready = await process.stdout.readline()
+        if not ready:
+            await worker.kill()
+            raise RuntimeError("Interpreter worker failed to start.")
+        self._workers.add(worker)
+        return worker
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+            self._idle = asyncio.Queue()
+            self._capacity = self.size
+            for worker in workers:
+                self._idle.put_nowait(worker)
+            logger.info(f"Started {self.size} interpreter workers.")
+
+    async def _replace(self, worker: _Worker) -> None:
+        self._workers.discard(worker)
+        await worker.kill()
+        self.restarts += 1
+        for attempt in range(SPAWN_ATTEMPTS):
+            try:
+                self._idle.put_nowait(await self._spawn())
+                return
+            except Exception as e:
+                logger.warning(f"Could not replace interpreter worker (attempt {attempt + 1}/{SPAWN_ATTEMPTS}): {e}")
+            if attempt + 1 < SPAWN_ATTEMPTS:
+                await asyncio.sleep(SPAWN_BACKOFF * 2 ** attempt)
+        self._capacity -= 1
+        logger.error(f"Giving up on an interpreter worker, {self._capacity} of {self.size} left.")
+        if self._capacity == 0:
+            # Wake the callers waiting for a worker, they fail fast from here on.
+            self._idle.put_nowait(None)
+
+    async def execute(self, code: str, timeout: Optional[float] = None) -> ExecutionResult:
+        if self._idle is None:
+            await self.start()
+        timeout = timeout or self.timeout
+        if self._capacity == 0:
+            return ExecutionResult(status="crashed", stderr="No interpreter workers are left.")
+        worker = await self._idle.get()
+        if worker is None:
+            self._idle.put_nowait(None)  # pass the wakeup on to the next waiter
+            return ExecutionResult(status="crashed", stderr="No interpreter workers are left.")
+        payload = {"code": code, "cpu_seconds": self.cpu_seconds, "max_output_chars": self.max_output_chars}
+        result = None
+        try:
+            reply = await asyncio.wait_for(worker.request(payload), timeout=timeout)
+            result = ExecutionResult(**reply)
+        except asyncio.TimeoutError:
+            result = ExecutionResult(status="timeout", stderr=f"Execution timed out after {timeout} seconds.", duration=timeout)
+        except Exception as e:
+            result = ExecutionResult(status="crashed", stderr=f"Interpreter worker crashed: {e}")
+        finally:
+            # No result means the caller was cancelled mid-request, and the worker may still send its reply.
+            if result is None or result.status in ("timeout", "crashed"):
+                task = asyncio.ensure_future(self._replace(worker))
+                self._replacements.add(task)
+                task.add_done_callback(self._replacements.discard)
+            else:
+                self._idle.put_nowait(worker)
+        return result
+
+    async def close(self) -> None:
+        if self._replacements:
+            await asyncio.gather(*self._replacements, return_exceptions=True)
+        for worker in list(self._workers):
+            await worker.kill()
+        self._workers.clear()
+        self._idle = None
+
+
+class CodeRunner:
+    def __init__(
+            self,
+            backend: str = "pool",
+            pool: Optional[InterpreterPool] = None,
+            cache_size: int = 1024,
+            timeout: float = 10,
+            fast_path: bool = True,
+            max_output_chars: int = 20000
+    ) -> None:
+        """
+        Runs each snippet exactly once on the configured backend and caches results by a hash of the
+        normalized code, so retries that regenerate identical code are not executed again.
+        Pure arithmetic snippets are evaluated directly from the AST when fast_path is set.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown execution backend: {backend}")
+        self.backend = backend
+        self.timeout = timeout
+        self._pool = pool if pool is not None or backend != "pool" else InterpreterPool(timeout=timeout)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, ExecutionResult] = OrderedDict()
+        self.fast_path = fast_path
+        self.max_output_chars = max_output_chars
+        self.hits = 0
+        self.misses = 0
+        self.runs = 0
+        self.fast_path_runs = 0
+        self.rejected = 0
+
+    async def run(self, response: str) -> ExecutionResult:
+        """
+        Execute the Python code blocks of an LLM response. Code that does not compile is rejected
+        without starting a backend.
+        """
+        code, rejected = preflight(response)
+        if rejected is not None:
+            self.rejected += 1
+            return rejected
+        self.runs += 1
+
+        if self.fast_path:
+            result = evaluate_arithmetic(code, max_output_chars=self.max_output_chars)
+            if result is not None:
+                self.fast_path_runs += 1
+                return result
+
+        key = hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        result = await self._execute(code)
+        if self.cache_size and result.status in CACHEABLE_STATUSES:
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    async def _execute(self, code: str) -> ExecutionResult:
+        if self.backend == "pool":
+            return await self._pool.execute(code, timeout=self.timeout)
+        if self.backend == "subprocess":
+            return await execute_subprocess(code, timeout=self.timeout, max_output_chars=self.max_output_chars)
+        try:
+            # The thread cannot be interrupted, a timed-out snippet keeps running in the background.
+            return await asyncio.wait_for(asyncio.to_thread(execute_in_process, code, self.max_output_chars), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return ExecutionResult(status="timeout", stderr=f"Execution timed out after {self.timeout} seconds.", duration=self.timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "fast_path_fraction": self.fast_path_runs / self.runs if self.runs else 0.0,
+            "rejected_by_preflight": self.rejected,
+        }
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
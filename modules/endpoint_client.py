@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Sequence, Union
+
+import httpx
+import openai
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from .batching_client import BatchingCompletionClient
+from .prompt_layout import SharedPrefixTracker
+
+logger = logging.getLogger(__name__)
+
+# Keys of an agents.<name> config entry that are passed to OpenAIChatCompletionClient.
+CLIENT_ARG_KEYS = (
+    "model", "base_url", "api_key", "temperature", "top_p", "max_tokens", "seed", "stop",
+    "frequency_penalty", "presence_penalty", "timeout", "model_capabilities", "model_info",
+)
+# Responses that mean the server is overloaded rather than the request being wrong.
+OVERLOAD_STATUS_CODES = (429, 503)
+
+
+def agent_client_args(agents_config: Mapping[str, Any], agent_name: str) -> Dict[str, Any]:
+    """
+    Client arguments of an agent: agents.endpoint_defaults overridden by agents.<agent_name>.
+    """
+    defaults = agents_config.get("endpoint_defaults", {}) or {}
+    agent_config = agents_config.get(agent_name, {}) or {}
+    merged = {**defaults, **agent_config}
+    missing = [key for key in ("model", "base_url") if not merged.get(key)]
+    if missing:
+        raise ValueError(f"agents.{agent_name} is missing {missing}")
+    return {key: merged[key] for key in CLIENT_ARG_KEYS if key in merged}
+
+
+def is_overload_error(error: BaseException) -> bool:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    # The OpenAI SDK wraps httpx timeouts in APITimeoutError, which carries no status code.
+    timeout_errors = (openai.APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError)
+    return status_code in OVERLOAD_STATUS_CODES or isinstance(error, timeout_errors)
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(
+            self,
+            name: str,
+            initial_limit: int = 32,
+            min_limit: int = 1,
+            max_limit: int = 256,
+            backoff: float = 0.5,
+            latency_tolerance: float = 2.0,
+            smoothing: float = 0.1,
+            baseline_decay: float = 0.01
+    ) -> None:
+        """
+        AIMD limit on in-flight requests to one endpoint. Every successful request grows the limit by
+        1/limit (about +1 per round of requests); a 429/503, a timeout or per-token latency above
+        latency_tolerance times the client's baseline latency multiplies it by `backoff`, at most once per
+        round, since requests already in flight report the same overload.
+        Latency and baseline are kept per client: agents' prompt and output lengths differ too much to
+        share one. The baseline is the best observed latency, drifting up by `baseline_decay` of the gap
+        per sample so that one unusually fast request does not count as the norm forever.
+        """
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline_decay = baseline_decay
+        self.in_flight = 0
+        self.latency: Dict[str, float] = {}  # client -> smoothed seconds per generated token
+        self.best_latency: Dict[str, float] = {}  # client -> baseline seconds per generated token
+        self._last_decrease = 0.0
+        self._waiters: List[asyncio.Future] = []
+        self.increases = 0
+        self.decreases = 0
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot. Returns the request start time, to be passed back to release.
+        """
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                if waiter.done() and not waiter.cancelled():
+                    # Woken, then cancelled before taking the slot: hand the wakeup to the next waiter.
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: float, token_latency: Optional[float] = None, overloaded: bool = False, client: str = "") -> None:
+        self.in_flight -= 1
+        if token_latency is not None:
+            latency = self.latency.get(client)
+            latency = token_latency if latency is None else (1 - self.smoothing) * latency + self.smoothing * token_latency
+            best = self.best_latency.get(client)
+            best = latency if best is None else min(latency, best + self.baseline_decay * (latency - best))
+            self.latency[client], self.best_latency[client] = latency, best
+            overloaded = overloaded or latency > self.latency_tolerance * best
+
+        if overloaded:
+            if started >= self._last_decrease:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = time.monotonic()
+                self.decreases += 1
+                logger.info(f"[{self.name}] Overload, concurrency limit lowered to {int(self.limit)}.")
+        elif token_latency is not None:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.increases += 1
+        self._wake()
+
+    def _wake(self) -> None:
+        slots = int(self.limit) - self.in_flight
+        for waiter in self._waiters[:max(slots, 0)]:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "latency_per_token": dict(self.latency),
+        }
+
+
+class LimitedChatCompletionClient:
+    def __init__(
+            self,
+            model_client: ChatCompletionClient,
+            limiter: AdaptiveConcurrencyLimiter,
+            max_retries: int = 3,
+            retry_delay: float = 1.0,
+            name: str = "",
+            prefix_tracker: Optional[SharedPrefixTracker] = None
+    ) -> None:
+        """
+        Runs `create` under the endpoint's concurrency limiter. Overloaded requests are retried here
+        (the OpenAI SDK's own retries are disabled) so the limiter sees every 429/503.
+        Other attributes are delegated to the wrapped client.
+        """
+        self._model_client = model_client
+        self._limiter = limiter
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.name = name
+        self.prefix_tracker = prefix_tracker
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._model_client, name)
+
+    async def create(self, messages: Sequence[LLMMessage], **kwargs: Any) -> CreateResult:
+        if self.prefix_tracker is not None:
+            self.prefix_tracker.observe(messages)
+        attempt = 0
+        while True:
+            started = await self._limiter.acquire()
+            token_latency, overloaded = None, False
+            try:
+                result = await self._model_client.create(messages, **kwargs)
+                completion_tokens = result.usage.completion_tokens if result.usage else 0
+                token_latency = (time.monotonic() - started) / (1 + completion_tokens)
+                return result
+            except Exception as e:
+                overloaded = is_overload_error(e)
+                if not overloaded or attempt >= self.max_retries:
+                    raise
+            finally:
+                self._limiter.release(started, token_latency=token_latency, overloaded=overloaded, client=self.name)
+            attempt += 1
+            await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    async def create_stream(self, messages: Sequence[LLMMessage], **kwargs: Any) -> AsyncGenerator[Union[str, CreateResult], None]:
+        """
+        Streams under the limiter, holding the slot until the stream ends or is closed.
+        Overloads are only retried before the first chunk. The latency sample is decode time only
+        (after the first chunk); a stream stopped early gives none.
+        """
+        if self.prefix_tracker is not None:
+            self.prefix_tracker.observe(messages)
+        attempt = 0
+        while True:
+            started = await self._limiter.acquire()
+            token_latency, overloaded, chunks, first_chunk = None, False, 0, None
+            try:
+                async for chunk in self._model_client.create_stream(messages, **kwargs):
+                    if isinstance(chunk, str):
+                        chunks += 1
+                        if first_chunk is None:
+                            first_chunk = time.monotonic()
+                    yield chunk
+                if chunks > 1:
+                    token_latency = (time.monotonic() - first_chunk) / (chunks - 1)
+                return
+            except Exception as e:
+                overloaded = is_overload_error(e)
+                if not overloaded or chunks or attempt >= self.max_retries:
+                    raise
+            finally:
+                self._limiter.release(started, token_latency=token_latency, overloaded=overloaded, client=self.name)
+            attempt += 1
+            await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+
+class EndpointPool:
+    def __init__(self, defaults: Optional[Mapping[str, Any]] = None) -> None:
+        """
+        One pooled HTTP connection set and one adaptive concurrency limiter per vLLM base_url,
+        shared by every agent client that points at that endpoint. Agents with batching enabled get
+        a micro-batching client under the limiter.
+        """
+        defaults = defaults or {}
+        self.max_connections = defaults.get("max_connections", 256)
+        self.concurrency = defaults.get("concurrency", {}) or {}
+        self.batching = defaults.get("batching", {}) or {}
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+        self._limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+        self._batchers: List[BatchingCompletionClient] = []
+        self._prefix_trackers: List[SharedPrefixTracker] = []
+
+    def http_client(self, base_url: str) -> httpx.AsyncClient:
+        if base_url not in self._http_clients:
+            self._http_clients[base_url] = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.concurrency.get("request_timeout", 600), connect=5.0),
+            )
+        return self._http_clients[base_url]
+
+    def limiter(self, base_url: str) -> AdaptiveConcurrencyLimiter:
+        if base_url not in self._limiters:
+            self._limiters[base_url] = AdaptiveConcurrencyLimiter(
+                name=base_url,
+                initial_limit=self.concurrency.get("initial", 32),
+                min_limit=self.concurrency.get("min", 1),
+                max_limit=self.concurrency.get("max", 256),
+                backoff=self.concurrency.get("backoff", 0.5),
+                latency_tolerance=self.concurrency.get("latency_tolerance", 2.0),
+                baseline_decay=self.concurrency.get("baseline_decay", 0.01),
+            )
+        return self._limiters[base_url]
+
+    def create_client(
+            self,
+            name: str,
+            client_args: Mapping[str, Any],
+            batching: Optional[Mapping[str, Any]] = None,
+            tokenizer: Optional[str] = None
+    ) -> LimitedChatCompletionClient:
+        """
+        `batching` overrides the endpoint_defaults batching settings for this agent.
+        """
+        base_url = client_args["base_url"]
+        model_client = OpenAIChatCompletionClient(**client_args, http_client=self.http_client(base_url), max_retries=0)
+        batching = {**self.batching, **(batching or {})}
+        if batching.get("enabled", False):
+            model_client = BatchingCompletionClient(
+                model_client,
+                client_args,
+                http_client=self.http_client(base_url),
+                tokenizer=tokenizer,
+                batch_window=batching.get("window_ms", 10) / 1000,
+                max_batch_size=batching.get("max_batch_size", 32),
+                name=name,
+            )
+            self._batchers.append(model_client)
+        prefix_tracker = SharedPrefixTracker(name)
+        self._prefix_trackers.append(prefix_tracker)
+        return LimitedChatCompletionClient(
+            model_client,
+            self.limiter(base_url),
+            max_retries=self.concurrency.get("max_retries", 3),
+            retry_delay=self.concurrency.get("retry_delay", 1.0),
+            name=name,
+            prefix_tracker=prefix_tracker,
+        )
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [limiter.stats() for limiter in self._limiters.values()] + [batcher.stats() for batcher in self._batchers]
+
+    def prefix_stats(self) -> List[Dict[str, Any]]:
+        """
+        Per agent client: how much of each prompt repeats the start of a recent prompt to the same client.
+        """
+        return [tracker.stats() for tracker in self._prefix_trackers]
+
+    async def close(self) -> None:
+        for batcher in self._batchers:
+            await batcher.close()
+        self._batchers.clear()
+        for http_client in self._http_clients.values():
+            await http_client.aclose()
+        self._http_clients.clear()
@@ -0,0 +1,93 @@
+"""
+Worker process of modules.code_execution.InterpreterPool.
+
+Reads one JSON request per line on stdin ({"code": ..., "cpu_seconds": ...}), executes the code in a fresh
+namespace and writes one JSON result per line. Common libraries are imported once at startup, so snippets
+only pay for their own execution.
+"""
+import io
+import json
+import os
+import resource
+import sys
+import time
+import traceback
+
+PRELOAD_MODULES = ("math", "numpy", "pandas")
+
+
+def set_memory_limit(memory_mb: int) -> None:
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def set_cpu_limit(cpu_seconds: float) -> None:
+    """
+    RLIMIT_CPU counts the whole process lifetime, so the limit is moved to the time used so far plus the budget.
+    Exceeding it raises SIGXCPU and kills the worker, which the pool then replaces.
+    """
+    if not cpu_seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def truncate(text: str, max_chars: int) -> str:
+    if max_chars and len(text) > max_chars:
+        return text[:max_chars] + f"\n...[{len(text) - max_chars} characters truncated]"
+    return text
+
+
+def execute(code: str, max_output_chars: int = 0) -> dict:
+    stdout, stderr = io.StringIO(), io.StringIO()
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = stdout, stderr
+    status, exception_type = "ok", None
+    start = time.perf_counter()
+    try:
+        exec(compile(code, "<snippet>", "exec"), {"__name__": "__main__"})
+    except BaseException as e:  # SystemExit and KeyboardInterrupt from user code must not end the worker
+        status, exception_type = "error", type(e).__name__
+        traceback.print_exc(file=stderr)
+    finally:
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+    return {
+        "status": status,
+        "stdout": truncate(stdout.getvalue(), max_output_chars),
+        "stderr": truncate(stderr.getvalue(), max_output_chars),
+        "duration": time.perf_counter() - start,
+        "exception_type": exception_type,
+    }
+
+
+def main() -> None:
+    memory_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+
+    # Keep the protocol on a private copy of stdout; stray writes to fd 1 from C code go to stderr instead.
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+    set_memory_limit(memory_mb)
+
+    protocol.write(json.dumps({"status": "ready"}) + "\n")
+    protocol.flush()
+    for line in sys.stdin:
+        request = json.loads(line)
+        set_cpu_limit(request.get("cpu_seconds"))
+        protocol.write(json.dumps(execute(request["code"], request.get("max_output_chars", 0))) + "\n")
+        protocol.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+
+logger = logging.getLogger(__name__)
+
+# Client settings that change the completion. Connection details such as api_key are left out.
+SAMPLING_KEYS = ("model", "temperature", "top_p", "max_tokens", "seed", "stop", "frequency_penalty", "presence_penalty")
+
+
+class ResponseCache:
+    def __init__(self, path: str, max_entries: int = 100000, ttl_seconds: Optional[float] = None, evict_every: int = 100) -> None:
+        """
+        SQLite store for completions with TTL expiry and least-recently-used size eviction.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evict_every = max(1, evict_every)
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                (overflow,),
+            )
+            logger.info(f"Evicted {overflow} cached responses from {self.path}.")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedChatCompletionClient:
+    def __init__(self, model_client: ChatCompletionClient, cache: ResponseCache, create_args: Mapping[str, Any], name: str = "") -> None:
+        """
+        Wraps a ChatCompletionClient and memoizes `create` by a content hash of
+        (model, messages, sampling params). Other attributes are delegated to the wrapped client.
+        """
+        self._model_client = model_client
+        self._cache = cache
+        self._sampling = {k: create_args[k] for k in SAMPLING_KEYS if k in create_args}
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._model_client, name)
+
+    def _cache_key(self, messages: Sequence[LLMMessage], json_output: Any, extra_create_args: Mapping[str, Any]) -> str:
+        serialized = [
+            message.model_dump(exclude={"source"}) if hasattr(message, "model_dump") else str(message)
+            for message in messages
+        ]
+        payload = json.dumps(
+            {
+                "sampling": {**self._sampling, **dict(extra_create_args)},
+                "json_output": json_output if isinstance(json_output, (bool, type(None))) else str(json_output),
+                "messages": serialized,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Any] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> CreateResult:
+        if tools:
+            return await self._model_client.create(
+                messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token, **kwargs
+            )
+
+        key = self._cache_key(messages, json_output, extra_create_args)
+        cached = await asyncio.to_thread(self._cache.get, key)
+        if cached is not None:
+            self.hits += 1
+            return CreateResult.model_validate_json(cached).model_copy(update={"cached": True})
+
+        self.misses += 1
+        result = await self._model_client.create(
+            messages, json_output=json_output, extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token, **kwargs
+        )
+        if isinstance(result.content, str):
+            await asyncio.to_thread(self._cache.put, key, result.model_dump_json())
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Any] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        """
+        Cache hits are replayed as a single chunk. Only streams that run to their final result are stored,
+        so a stream closed early by the caller leaves no partial entry.
+        """
+        if tools:
+            async for chunk in self._model_client.create_stream(
+                messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token, **kwargs
+            ):
+                yield chunk
+            return
+
+        key = self._cache_key(messages, json_output, extra_create_args)
+        cached = await asyncio.to_thread(self._cache.get, key)
+        if cached is not None:
+            self.hits += 1
+            result = CreateResult.model_validate_json(cached).model_copy(update={"cached": True})
+            if isinstance(result.content, str):
+                yield result.content
+            yield result
+            return
+
+        self.misses += 1
+        async for chunk in self._model_client.create_stream(
+            messages, json_output=json_output, extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token, **kwargs
+        ):
+            if not isinstance(chunk, str) and isinstance(chunk.content, str):
+                await asyncio.to_thread(self._cache.put, key, chunk.model_dump_json())
+            yield chunk
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
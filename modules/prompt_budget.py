@@ -0,0 +1,138 @@
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from transformers import AutoTokenizer
+except ImportError:  # transformers is optional, token counts fall back to a character estimate
+    AutoTokenizer = None
+
+logger = logging.getLogger(__name__)
+
+# Trimming policies for a prompt part:
+#   "head": keep the beginning, cut the end (documents, extracted values)
+#   "tail": keep the end, cut the beginning (review history, tracebacks: the newest text is last)
+#   "drop": remove the part entirely
+TRIM_POLICIES = ("head", "tail", "drop")
+TRUNCATION_MARKER = "\n...[truncated]...\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about four characters per token) for budgeting prompt context.
+    """
+    return (len(text) + 3) // 4
+
+
+def load_local_tokenizer(tokenizer: str, owner: str = ""):
+    """
+    Load a Hugging Face tokenizer from the local cache only. Returns None when it is not available.
+    """
+    if AutoTokenizer is None:
+        logger.warning(f"[{owner}] transformers is not installed, tokenizer {tokenizer!r} is unavailable.")
+        return None
+    try:
+        return AutoTokenizer.from_pretrained(tokenizer, local_files_only=True)
+    except Exception as e:
+        logger.warning(f"[{owner}] Could not load tokenizer {tokenizer!r} locally ({e}).")
+        return None
+
+
+class PromptBudgeter:
+    def __init__(self, name: str, max_prompt_tokens: Optional[int] = None, tokenizer: Optional[str] = None) -> None:
+        """
+        Counts prompt tokens with the served model's tokenizer and trims prompt parts to a per-agent limit.
+        The tokenizer is loaded from the local Hugging Face cache only; without it a 4 chars/token estimate is used.
+        """
+        self.name = name
+        self.max_prompt_tokens = max_prompt_tokens
+        self.truncations = 0
+        self._tokenizer = None
+        if tokenizer and max_prompt_tokens:
+            self._tokenizer = load_local_tokenizer(tokenizer, owner=name)
+            if self._tokenizer is None:
+                logger.warning(f"[{name}] Estimating token counts from characters.")
+
+    def count_tokens(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._tokenizer is None:
+            return estimate_tokens(text)
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int, policy: str = "head") -> str:
+        """
+        Cut text to at most max_tokens, keeping its beginning ("head") or its end ("tail").
+        """
+        if policy == "drop" or max_tokens <= 0:
+            return ""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        if self._tokenizer is None:
+            max_chars = max_tokens * 4
+            kept = text[:max_chars] if policy == "head" else text[-max_chars:]
+        else:
+            ids = self._tokenizer.encode(text, add_special_tokens=False)
+            kept_ids = ids[:max_tokens] if policy == "head" else ids[-max_tokens:]
+            kept = self._tokenizer.decode(kept_ids)
+        return kept + TRUNCATION_MARKER if policy == "head" else TRUNCATION_MARKER + kept
+
+    def fit(
+            self,
+            render: Callable[..., str],
+            parts: Dict[str, str],
+            trim_order: Sequence[Tuple[str, str]],
+            overhead: str = ""
+    ) -> str:
+        """
+        Render the prompt from its parts, trimming parts in trim_order until the prompt plus
+        overhead (e.g. the system message) fits max_prompt_tokens.
+        """
+        prompt = render(**parts)
+        if not self.max_prompt_tokens:
+            return prompt
+
+        budget = self.max_prompt_tokens - self.count_tokens(overhead)
+        total = self.count_tokens(prompt)
+        if total <= budget:
+            return prompt
+
+        parts = dict(parts)
+        trimmed: List[str] = []
+        for part, policy in trim_order:
+            if policy not in TRIM_POLICIES:
+                raise ValueError(f"Unknown trim policy: {policy}")
+            overflow = total - budget
+            if overflow <= 0:
+                break
+            text = parts.get(part) or ""
+            part_tokens = self.count_tokens(text)
+            if not part_tokens:
+                continue
+            # Leave room for the truncation marker.
+            keep = part_tokens - overflow - self.count_tokens(TRUNCATION_MARKER)
+            parts[part] = self.truncate(text, keep, policy)
+            trimmed.append(f"{part}({policy}): {part_tokens}->{self.count_tokens(parts[part])}")
+            prompt = render(**parts)
+            total = self.count_tokens(prompt)
+
+        self.truncations += 1
+        if total > budget:
+            logger.warning(f"[{self.name}] Prompt still has {total} tokens after trimming {trimmed}, limit is {budget}.")
+        else:
+            logger.warning(f"[{self.name}] Prompt over the {budget} token limit, trimmed {trimmed}.")
+        return prompt
+
+
+def fit_prompt(
+        budgeter: Optional[PromptBudgeter],
+        render: Callable[..., str],
+        parts: Dict[str, str],
+        trim_order: Sequence[Tuple[str, str]],
+        overhead: str = ""
+) -> str:
+    """
+    Render a prompt through the budgeter, or unchanged when the agent has no budgeter.
+    """
+    if budgeter is None:
+        return render(**parts)
+    return budgeter.fit(render, parts, trim_order, overhead=overhead)
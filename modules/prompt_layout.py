@@ -0,0 +1,58 @@
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Sequence
+
+from autogen_core.models import LLMMessage
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_text(messages: Sequence[LLMMessage]) -> str:
+    """
+    The text of a request as the server sees it, up to the chat template markup.
+    """
+    return "\n".join(f"{message.type}: {message.content}" for message in messages)
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    """
+    Length of the longest common prefix, by binary search over slice comparisons (done in C).
+    """
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class SharedPrefixTracker:
+    def __init__(self, name: str, window: int = 16) -> None:
+        """
+        Measures how much of each prompt an agent sends repeats the start of one of its `window` previous
+        prompts, i.e. the part vLLM's automatic prefix caching can serve from the KV cache.
+        """
+        self.name = name
+        self._recent: Deque[str] = deque(maxlen=window)
+        self.prompts = 0
+        self.prompt_chars = 0
+        self.shared_chars = 0
+
+    def observe(self, messages: Sequence[LLMMessage]) -> int:
+        text = prompt_text(messages)
+        shared = max((common_prefix_length(text, previous) for previous in self._recent), default=0)
+        self._recent.append(text)
+        self.prompts += 1
+        self.prompt_chars += len(text)
+        self.shared_chars += shared
+        return shared
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "prompts": self.prompts,
+            "mean_shared_prefix_chars": self.shared_chars / self.prompts if self.prompts else 0.0,
+            "shared_prefix_fraction": self.shared_chars / self.prompt_chars if self.prompt_chars else 0.0,
+        }
@@ -0,0 +1,228 @@
+import asyncio
+import csv
+import glob
+import logging
+import os
+from typing import Any, Dict, List, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .task_journal import TaskJournal
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_HEADERS = [
+    "task",
+    "context",
+    "question",
+    "answer",
+    "program",
+    "model_output",
+    "evaluations",
+    "reasoner_output",
+    "reasoner_actions",
+    "extractor_output",
+    "executor_output",
+    "verifier_output",
+]
+
+
+class StreamingCSVWriter:
+    def __init__(self, file_path: str, headers: List[str] = None, flush_every: int = 50, journal: Optional[TaskJournal] = None) -> None:
+        """
+        Append-only CSV writer. Rows are buffered and flushed in batches off the event loop.
+        Fingerprints of flushed rows are recorded in the journal, if one is given.
+        """
+        self.file_path = file_path
+        self.headers = headers or OUTPUT_HEADERS
+        self.flush_every = max(1, flush_every)
+        self.journal = journal
+        self._buffer: List[Dict[str, Any]] = []
+        self._fingerprints: List[str] = []
+        self._lock = asyncio.Lock()
+        self.rows_written = 0
+
+    async def write(self, row: Dict[str, Any], fingerprint: Optional[str] = None) -> None:
+        """
+        Buffer a row and flush the buffer once it reaches `flush_every` rows.
+        """
+        self._buffer.append(row)
+        if fingerprint:
+            self._fingerprints.append(fingerprint)
+        if len(self._buffer) >= self.flush_every:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Append all buffered rows to the file in a worker thread.
+        """
+        async with self._lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            fingerprints, self._fingerprints = self._fingerprints, []
+            await asyncio.to_thread(self._append_rows, rows)
+            if self.journal is not None:
+                await asyncio.to_thread(self.journal.mark_done, fingerprints)
+            self.rows_written += len(rows)
+            logger.info(f"Flushed {len(rows)} rows to {self.file_path} ({self.rows_written} total).")
+
+    async def close(self) -> None:
+        await self.flush()
+
+    def _append_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Write the header only when the file is new or empty, then append the rows.
+        """
+        directory = os.path.dirname(self.file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_header = not os.path.exists(self.file_path) or os.path.getsize(self.file_path) == 0
+
+        with open(self.file_path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.headers, extrasaction="ignore")
+            if write_header:
+                logger.info(f"File {self.file_path} does not exist. Creating a new file.")
+                writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ParquetResultWriter:
+    def __init__(self, file_path: str, headers: List[str] = None, flush_every: int = 500, compression: str = "zstd", journal: Optional[TaskJournal] = None) -> None:
+        """
+        Columnar writer. Rows are collected in memory and written as one compressed row group per flush.
+        """
+        self.file_path = self._resolve_path(file_path)
+        self.headers = headers or OUTPUT_HEADERS
+        self.flush_every = max(1, flush_every)
+        self.compression = compression
+        self.journal = journal
+        self.schema = pa.schema([(name, pa.string()) for name in self.headers])
+        self._buffer: List[Dict[str, Any]] = []
+        self._fingerprints: List[str] = []
+        self._lock = asyncio.Lock()
+        self._writer: Optional[pq.ParquetWriter] = None
+        self.rows_written = 0
+
+    @staticmethod
+    def _resolve_path(file_path: str) -> str:
+        """
+        Parquet files cannot be appended to, so an existing file gets a numbered sibling part.
+        """
+        if not os.path.exists(file_path):
+            return file_path
+        stem, ext = os.path.splitext(file_path)
+        part = 1
+        while os.path.exists(f"{stem}.part{part}{ext}"):
+            part += 1
+        new_path = f"{stem}.part{part}{ext}"
+        logger.info(f"File {file_path} already exists. Writing to {new_path}.")
+        return new_path
+
+    async def write(self, row: Dict[str, Any], fingerprint: Optional[str] = None) -> None:
+        self._buffer.append(row)
+        if fingerprint:
+            self._fingerprints.append(fingerprint)
+        if len(self._buffer) >= self.flush_every:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Write all buffered rows as a single row group in a worker thread.
+        """
+        async with self._lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            await asyncio.to_thread(self._write_row_group, rows)
+            self.rows_written += len(rows)
+            logger.info(f"Wrote row group of {len(rows)} rows to {self.file_path} ({self.rows_written} total).")
+
+    async def close(self) -> None:
+        await self.flush()
+        async with self._lock:
+            if self._writer is not None:
+                await asyncio.to_thread(self._writer.close)
+                self._writer = None
+            # The file is only readable once its footer is written, so tasks are journaled on close.
+            fingerprints, self._fingerprints = self._fingerprints, []
+            if self.journal is not None:
+                await asyncio.to_thread(self.journal.mark_done, fingerprints)
+
+    def _write_row_group(self, rows: List[Dict[str, Any]]) -> None:
+        if self._writer is None:
+            directory = os.path.dirname(self.file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._writer = pq.ParquetWriter(self.file_path, self.schema, compression=self.compression)
+
+        columns = {
+            name: [None if row.get(name) is None else str(row.get(name)) for row in rows]
+            for name in self.headers
+        }
+        table = pa.Table.from_pydict(columns, schema=self.schema)
+        self._writer.write_table(table, row_group_size=len(rows))
+
+
+def output_file_path(file_path: str, output_format: str = "csv") -> str:
+    """
+    The path results are written to: parquet output always gets a .parquet extension.
+    """
+    if output_format not in ("csv", "parquet"):
+        raise ValueError(f"Unknown output format: {output_format}")
+    stem, ext = os.path.splitext(file_path)
+    if output_format == "parquet" and ext != ".parquet":
+        return f"{stem}.parquet"
+    return file_path
+
+
+def shard_file_path(file_path: str, shard_index: int) -> str:
+    stem, ext = os.path.splitext(file_path)
+    return f"{stem}.shard{shard_index}{ext}"
+
+
+def create_result_writer(file_path: str, output_format: str = "csv", flush_every: int = 50, journal: Optional[TaskJournal] = None):
+    """
+    Build the result writer for the requested output format.
+    """
+    file_path = output_file_path(file_path, output_format)
+    if output_format == "csv":
+        return StreamingCSVWriter(file_path=file_path, flush_every=flush_every, journal=journal)
+    return ParquetResultWriter(file_path=file_path, flush_every=flush_every, journal=journal)
+
+
+def merge_shard_outputs(file_path: str, output_format: str = "csv") -> int:
+    """
+    Append the rows of per-shard output files (<stem>.shard<i><ext>) to the main output and delete them.
+    Their tasks are already journaled by the shard processes. Returns the number of merged rows.
+    """
+    file_path = output_file_path(file_path, output_format)
+    stem, ext = os.path.splitext(file_path)
+    shard_paths = sorted(glob.glob(f"{glob.escape(stem)}.shard*{ext}"))
+    if not shard_paths:
+        return 0
+
+    if output_format == "csv":
+        rows = []
+        for path in shard_paths:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                rows.extend(csv.DictReader(f))
+        if rows:
+            StreamingCSVWriter(file_path=file_path)._append_rows(rows)
+    else:
+        tables = []
+        for path in shard_paths:
+            try:
+                tables.append(pq.read_table(path))
+            except (pa.ArrowInvalid, OSError) as e:
+                # A shard killed before close has no footer; its tasks were never journaled and will rerun.
+                logger.warning(f"Skipping unreadable shard file {path}: {e}")
+        rows = pa.concat_tables(tables) if tables else []
+        if len(rows):
+            pq.write_table(rows, ParquetResultWriter._resolve_path(file_path), compression="zstd")
+
+    for path in shard_paths:
+        os.remove(path)
+    logger.info(f"Merged {len(rows)} rows from {len(shard_paths)} shard files into {file_path}.")
+    return len(rows)
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, LLMMessage
+
+logger = logging.getLogger(__name__)
+
+
+async def create_until(
+        model_client: ChatCompletionClient,
+        messages: Sequence[LLMMessage],
+        stop_when: Callable[[str], bool],
+        cancellation_token: Optional[CancellationToken] = None,
+        **kwargs: Any
+) -> Tuple[str, bool]:
+    """
+    Stream a completion and stop it as soon as stop_when(text so far) is true.
+    Returns the text and whether the completion was stopped early.
+
+    The stream is consumed in its own task, which is cancelled on a match. The task is then waiting on
+    the next chunk, so the cancellation reaches the HTTP read and closes the response, and vLLM aborts
+    the request instead of decoding the rest of it.
+    """
+    text = ""
+    matched: Optional[str] = None
+    found = asyncio.Event()
+
+    async def consume() -> None:
+        nonlocal text, matched
+        async for chunk in model_client.create_stream(messages, cancellation_token=cancellation_token, **kwargs):
+            if not isinstance(chunk, str):
+                # The final CreateResult carries the full content.
+                if isinstance(chunk.content, str):
+                    text = chunk.content
+                continue
+            text += chunk
+            if matched is None and stop_when(text):
+                matched = text
+                found.set()
+
+    consumer = asyncio.ensure_future(consume())
+    waiter = asyncio.ensure_future(found.wait())
+    try:
+        await asyncio.wait({consumer, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        waiter.cancel()
+        if not consumer.done():
+            consumer.cancel()
+        results = await asyncio.gather(consumer, return_exceptions=True)
+
+    if matched is not None:
+        # Errors after the match, including the cancellation itself, do not matter.
+        return matched, isinstance(results[0], asyncio.CancelledError)
+    if isinstance(results[0], BaseException):
+        raise results[0]
+    return text, False
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, Set
+
+from dataclass import TaskInput
+
+logger = logging.getLogger(__name__)
+
+
+def task_fingerprint(input_data: TaskInput, config: Dict[str, Any]) -> str:
+    """
+    Stable identifier of a task: a hash of its question, context and the run configuration.
+    """
+    payload = json.dumps(
+        {
+            "task": input_data.task,
+            "question": input_data.question,
+            "context": input_data.context,
+            "config": config,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TaskJournal:
+    def __init__(self, file_path: str) -> None:
+        """
+        Append-only journal of completed task fingerprints, one per line.
+        """
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._done: Set[str] = set()
+
+    def load(self) -> Set[str]:
+        """
+        Read the fingerprints recorded by previous runs. A partially written last line is ignored.
+        """
+        self._done = set()
+        if os.path.exists(self.file_path):
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    fingerprint = line.strip()
+                    if len(fingerprint) == 64:
+                        self._done.add(fingerprint)
+        logger.info(f"Loaded {len(self._done)} completed tasks from {self.file_path}.")
+        return set(self._done)
+
+    def reset(self) -> None:
+        self._done = set()
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+            logger.info(f"Removed journal {self.file_path}.")
+
+    def is_done(self, fingerprint: str) -> bool:
+        return fingerprint in self._done
+
+    def mark_done(self, fingerprints: Iterable[str]) -> None:
+        """
+        Durably record fingerprints. Called only after the matching rows were written.
+        """
+        new = [fp for fp in fingerprints if fp and fp not in self._done]
+        if not new:
+            return
+        with self._lock:
+            directory = os.path.dirname(self.file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.file_path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{fp}\n" for fp in new))
+                f.flush()
+                os.fsync(f.fileno())
+            self._done.update(new)
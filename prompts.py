@@ -2,6 +2,12 @@
 
 from typing import List, Dict, Union
 
+# Prompt layouts, built from the same instruction constants and per-task parts and differing only in their order:
+#   "default": the original order, per-task parts interleaved with the instructions
+#   "prefix_cache": static instructions first, then the task's shared context, then the per-call parts,
+#                   so calls within a task share a long byte-identical prefix for vLLM's prefix cache
+PROMPT_LAYOUTS = ("default", "prefix_cache")
+
 SYS_PROMPT_EXECUTOR = """
 You are tasked with writing Python code based on the provided context. Follow these guidelines to ensure the code is accurate, efficient, and free from common mistakes:
 
@@ -268,6 +274,55 @@ def construct_reason_prompt(input_data: TaskInput) -> str:
 
     return prompt
 
+EXECUTOR_INTRO = "Please NOTE You are tasked with writing Python code based on the provided context. THINK THIS STEP BY STEP\n"
+EXECUTOR_RULES = (
+    "Make sure that initialize extracted value at the start of your code.\n"
+    "IGNORE THE symbol like $, million.... ONLY FOCUS ON NUMBERS\n"
+    "You need to end with code by print(answer). And answer within 10 lines of code.\n"
+    "** ALWAYS REMEMBER THE Instructions.\n"
+)
+
+
+def construct_executor_prompt(formula: str, extracted_values: str, question: str, layout: str = "default") -> str:
+    question_line = f"Here is the question to answer {question}.\n"
+    values_line = f"Here is the extracted value {extracted_values}.\n"
+    formula_line = f"Here is the formula from other assistant {formula}\n"
+    if layout == "prefix_cache":
+        return f"{EXECUTOR_INTRO}{EXECUTOR_RULES}{question_line}{values_line}{formula_line}"
+    return f"{EXECUTOR_INTRO}{formula_line}{values_line}{question_line}{EXECUTOR_RULES}"
+
+
+def construct_executor_refine_prompt(formula: str, extracted_values: str, previous_code: str, review: str, question: str = "", layout: str = "default") -> str:
+    # Extends the first attempt's prompt in either layout, the code and review of this round come last.
+    return (f"{construct_executor_prompt(formula, extracted_values, question, layout=layout)}"
+            f"Your previous code: {previous_code}\n"
+            f"Here are the comments from the Verifier agent to help you refine your answer: {review}\n"
+            f"Refine your code accordingly. Ensure it ends with print(answer) and within 10 lines.")
+
+
+def construct_executor_retry_prompt(error_output: str, base_prompt: str, previous_code: str, layout: str = "default") -> str:
+    error_lines = f"Your previous code produced the following error:\n{error_output}\n"
+    code_line = f"Your previous Code: {previous_code}\n"
+    if layout == "prefix_cache":
+        return f"{base_prompt}{code_line}{error_lines}"
+    return f"{error_lines}{base_prompt}{code_line}"
+
+
+EXECUTE_REVIEW_TASK = "What’s the problem with the executor agent code? You should check the code line by line and give your review comments.\n"
+EXECUTE_REVIEW_FORMAT = (
+    "If there is ValueError, SyntaxError etc, you should set Approved: False\n"
+    "**Format your response as JSON**\n"
+    "End your response with: Approved: True or False.\n"
+)
+
+
+def construct_execute_review_prompt(code: str, code_res: str, layout: str = "default") -> str:
+    code_lines = f"executor agent code: {code}\ncode executed results: {code_res}\n"
+    if layout == "prefix_cache":
+        return f"{EXECUTE_REVIEW_TASK}{EXECUTE_REVIEW_FORMAT}{code_lines}"
+    return f"{EXECUTE_REVIEW_TASK}{code_lines}{EXECUTE_REVIEW_FORMAT}"
+
+
 REASON_ACTION_ClAIFY = "Clarify the question to ensure understanding."
 REASON_ACTION_QUESTION_STRUCTURE = "Break down the question into its structural components."
 REASON_ACTION_IDENTIFY_VAR = "Identify variables and it's meaning involved in the question."
@@ -283,22 +338,53 @@ ACTION_MEANINGS = {
 }
 
 
-def construct_action_evaluation_prompt(current_question: str, current_context: str, action: str) -> str:
+ACTION_EVALUATION_TASK = "You need to evaluate the following action and provide a score based on its effectiveness and correctness for answering the question.\n"
+ACTION_EVALUATION_FORMAT = (
+    '**Provide your response as a JSON object with two keys:**\n'
+    '- **"comments"**: A string containing your review comments.\n'
+    '- **"score"**: A numerical value between 0 and 1, where 1 indicates full approval and 0 indicates disapproval.\n'
+)
+
+
+def construct_action_evaluation_prompt(current_question: str, current_context: str, action: str, layout: str = "default") -> str:
     """
     Constructs the evaluation prompt for the VerifierAgent.
     """
     action_meaning = ACTION_MEANINGS.get(action, "No additional information available for this action.")
+    question_line = f"Question: {current_question}\n"
+    context_line = f"Context: {current_context}\n"
+    action_lines = f"Action: {action}\n**Action Meaning**: {action_meaning}\n"
+    if layout == "prefix_cache":
+        return f"{ACTION_EVALUATION_TASK}{ACTION_EVALUATION_FORMAT}{context_line}{question_line}{action_lines}"
+    return f"{ACTION_EVALUATION_TASK}{question_line}{context_line}{action_lines}{ACTION_EVALUATION_FORMAT}"
+
+
+BATCH_ACTION_EVALUATION_TASK = "You need to evaluate each of the following actions and provide a score based on its effectiveness and correctness for answering the question.\n"
+BATCH_ACTION_EVALUATION_FORMAT = (
+    '**Provide your response as a JSON object with two keys:**\n'
+    '- **"comments"**: A string containing your brief review comments.\n'
+    '- **"scores"**: An object mapping every listed action name to a numerical value between 0 and 1, where 1 indicates full approval and 0 indicates disapproval.\n'
+)
+
+
+def construct_batch_action_evaluation_prompt(current_question: str, current_context: str, actions: List[str], layout: str = "default") -> str:
+    """
+    Constructs a single evaluation prompt that asks the VerifierAgent to score every candidate action at once.
+    """
+    question_line = f"Question: {current_question}\n"
+    context_line = f"Context: {current_context}\n"
+    action_lines = "**Actions and their meaning:**\n" + "".join(
+        f"- {action}: {ACTION_MEANINGS.get(action, 'No additional information available for this action.')}\n"
+        for action in actions
+    )
+    score_lines = ",\n".join(f'    "{action}": <score>' for action in actions)
+    response_example = f'{{\n  "comments": "...",\n  "scores": {{\n{score_lines}\n  }}\n}}\n'
+    if layout == "prefix_cache":
+        return (f"{BATCH_ACTION_EVALUATION_TASK}{BATCH_ACTION_EVALUATION_FORMAT}"
+                f"{context_line}{question_line}{action_lines}{response_example}")
+    return (f"{BATCH_ACTION_EVALUATION_TASK}{question_line}{context_line}{action_lines}"
+            f"{BATCH_ACTION_EVALUATION_FORMAT}{response_example}")
 
-    prompt = f"""You need to evaluate the following action and provide a score based on its effectiveness and correctness. \n
-            Question: {current_question}
-            Context: {current_context}
-            Action: {action}
-            **Action Meaning**: {action_meaning}
-            **Provide your response as a JSON object with two keys:**
-            - **"comments"**: A string containing your review comments.
-            - **"score"**: A numerical value between 0 and 1, where 1 indicates full approval and 0 indicates disapproval.
-            """
-    return prompt
 
 # def construct_extractor_prompt(variables: str, relevant_chunks: List[Dict[str, Union[str, float]]], input_question: str) -> str:
 #     prompt = f"""The identified variables from another assistant are as follows:{variables}.
@@ -309,93 +395,94 @@ def construct_action_evaluation_prompt(current_question: str, current_context: s
 #     """
 #     return prompt
 
-def construct_extractor_prompt_1_turn(variables: str, relevant_chunks: List[Dict[str, Union[str, float]]], input_question: str) -> str:
-    return f"""
-    ─────────────────────────────  
-    Step 1: Chunk the Input  
-    ─────────────────────────────  
-    - **Paragraphs vs. Tables:**  
-      First, read the text and split it into its natural segments. Identify the sections that are narrative paragraphs and those that are tables.  
-    - **Example:**  
+EXTRACTOR_CHUNK_STEP = """
+    ─────────────────────────────
+    Step 1: Chunk the Input
+    ─────────────────────────────
+    - **Paragraphs vs. Tables:**
+      First, read the text and split it into its natural segments. Identify the sections that are narrative paragraphs and those that are tables.
+    - **Example:**
       If the text includes a table with rows like "2011 net revenue | $2,045" and a paragraph describing "net revenue decreased by $191 million", treat these as separate chunks.
-    ***Context:***
-    {relevant_chunks}
-    
-    ─────────────────────────────  
-    Step 2: Identify Key Variables  
-    ─────────────────────────────  
+"""
+EXTRACTOR_VARIABLE_STEP = """    ─────────────────────────────
+    Step 2: Identify Key Variables
+    ─────────────────────────────
     - From the text and tables, identify the numerical variables that are essential for the final calculation. For instance, these might be values like revenue figures or impact amounts.
     - Use the context provided by the text (keywords and surrounding phrases) to determine which numbers correspond to each variable.
-    ***Variables:***
-    {variables}
-    ─────────────────────────────  
-    Step 3: Multiple-Choice Extraction for Each Variable  
-    ─────────────────────────────  
+"""
+EXTRACTOR_EXTRACTION_STEPS = """    ─────────────────────────────
+    Step 3: Multiple-Choice Extraction for Each Variable
+    ─────────────────────────────
     For each key variable, do the following:
     1. Generate four multiple-choice options labeled A, B, C, and D. One of these options must be the correct value extracted from the text; the other three should be plausible distractors.
     2. Briefly explain your reasoning (chain-of-thought) for selecting the correct option.
-    
+
     **Example:**
-    
+
     Suppose you encounter the following text snippet:
-    
-    "According to the latest report, in 2011 the net re
-    venue reached $2,045 million, and in 2012 it was $1,854 million. Additionally, the report noted a $33 million impact from nuclear volume changes."
-    
+
+    "According to the latest report, in 2011 the net revenue reached $2,045 million, and in 2012 it was $1,854 million. Additionally, the report noted a $33 million impact from nuclear volume changes."
+
     For each variable, you might generate:
-    
+
     - **Variable: Net Revenue 2011**
       - Option A: $2,045 million  *(Correct)*
       - Option B: $1,854 million
       - Option C: $2,000 million
       - Option D: $2,100 million
       - **Explanation:** The phrase "in 2011 the net revenue reached" directly indicates that $2,045 million is the correct value.
-    
+
     - **Variable: Net Revenue 2012**
       - Option A: $1,854 million  *(Correct)*
       - Option B: $2,045 million
       - Option C: $1,900 million
       - Option D: $1,800 million
       - **Explanation:** The text states "in 2012 it was $1,854 million," so that is the correct figure.
-    ─────────────────────────────  
-    Step 5: Structured Output  
-    ─────────────────────────────  
+    ─────────────────────────────
+    Step 4: Structured Output
+    ─────────────────────────────
     Present your final answer in a structured format (e.g., JSON). Your output should include:
     - The correct value chosen for each key variable.
     - The computed results (like the revenue decrease and percentage).
     - A brief summary of your reasoning for each step.
-    
+
     **For Example, the final output could be structured as:**
-    
-    {{
+
+    {
       "net_revenue_2011": "$2,045 million",
       "net_revenue_2012": "$1,854 million",
       "nuclear_volume_effect": "$33 million",
       "net_revenue_decrease": "$191 million",
       "percentage_nuclear_volume": "17.3%"
-    }}
-    
-    ─────────────────────────────  
+    }
+
+    ─────────────────────────────
     Final Instructions:
-    ─────────────────────────────  
+    ─────────────────────────────
     1. Confirm that you understand these instructions.
     2. When processing any given input, first break it into paragraphs and tables.
     3. Identify the key variables using contextual clues.
     4. For each variable, create four multiple-choice options, select the correct one with a brief explanation, and then use these values for your final computations.
     5. Present your final answer in the structured format shown above.
-    
-    Please confirm that you understand these instructions, and then proceed with processing the provided input.  
-    Based on the previous analysis to answer the question: {input_question}
-    Therefore the answer to the question is xxx.  
-    """
 
-def construct_review_extractor_prompt(question: str, context: str, extraxt_results: str) -> str:
-    prompt = f"""
-    You are a Financial Data Verification Specialist with expertise in validating financial formulas and extracted data.
-    Here is question: {question}
-    Context: {context}
-    And Extracted Results: {extraxt_results} 
-    Your task is to:
+    Please confirm that you understand these instructions, and then proceed with processing the provided input.
+"""
+
+
+def construct_extractor_prompt_1_turn(variables: str, relevant_chunks: List[Dict[str, Union[str, float]]], input_question: str, layout: str = "default") -> str:
+    context_lines = f"    ***Context:***\n    {relevant_chunks}\n"
+    variable_lines = f"    ***Variables:***\n    {variables}\n"
+    question_lines = (f"    Based on the previous analysis to answer the question: {input_question}\n"
+                      f"    Therefore the answer to the question is xxx.\n")
+    if layout == "prefix_cache":
+        return (f"{EXTRACTOR_CHUNK_STEP}{EXTRACTOR_VARIABLE_STEP}{EXTRACTOR_EXTRACTION_STEPS}"
+                f"{context_lines}{variable_lines}{question_lines}")
+    return (f"{EXTRACTOR_CHUNK_STEP}{context_lines}{EXTRACTOR_VARIABLE_STEP}{variable_lines}"
+            f"{EXTRACTOR_EXTRACTION_STEPS}{question_lines}")
+
+
+REVIEW_EXTRACTOR_ROLE = "\n    You are a Financial Data Verification Specialist with expertise in validating financial formulas and extracted data.\n"
+REVIEW_EXTRACTOR_TASK = """    Your task is to:
     1. **Verify the Extracted Data:**
         - Ensure that all necessary numerical values corresponding to the identified variables have been accurately extracted.
         - Check for the presence of all required variables.
@@ -405,22 +492,27 @@ def construct_review_extractor_prompt(question: str, context: str, extraxt_resul
         - Highlight any missing values, incorrect extractions, or irrelevant data.
 
     3. **Provide Feedback:**
-        - Summarize your findings in a clear and concise manner to assist in correcting any issues.  
+        - Summarize your findings in a clear and concise manner to assist in correcting any issues.
     **Example:**
-    {{
-      "verification_result": {{
+    {
+      "verification_result": {
         "data_valid": false,
         "data_issues": [
           "Missing value for 'Commissions'."
         ]
-      }},
+      },
       "comments": "The 'Commissions' value is missing, which is essential for the Net Revenue calculation."
-    }}       
-    """
-    return prompt
-
+    }
+"""
 
 
+def construct_review_extractor_prompt(question: str, context: str, extraxt_results: str, layout: str = "default") -> str:
+    question_line = f"    Here is question: {question}\n"
+    context_line = f"    Context: {context}\n"
+    results_line = f"    And Extracted Results: {extraxt_results}\n"
+    if layout == "prefix_cache":
+        return f"{REVIEW_EXTRACTOR_ROLE}{REVIEW_EXTRACTOR_TASK}{context_line}{question_line}{results_line}"
+    return f"{REVIEW_EXTRACTOR_ROLE}{question_line}{context_line}{results_line}{REVIEW_EXTRACTOR_TASK}"
 
 
 ACTIONS = {
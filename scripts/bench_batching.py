@@ -0,0 +1,228 @@
+"""
+Benchmark of request micro-batching against one-request-per-call, using a local stub of a vLLM server.
+The stub serves /v1/completions and /v1/chat/completions like vLLM does: concurrent requests share one
+continuous-batching engine (a per-step decode cost over all running sequences), and only the API frontend's
+per-request work is serialized. The stub runs in its own process, so its HTTP handling does not compete
+with the client under test; what batching can save is frontend work, HTTP round trips and client-side
+per-request overhead.
+
+    python scripts/bench_batching.py --n 256 --window_ms 10 --max_batch_size 32
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autogen_core.models import SystemMessage, UserMessage
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from modules.batching_client import BatchingCompletionClient
+
+MODEL = "stub-model"
+MODEL_INFO = {"vision": False, "function_calling": False, "json_output": False, "family": "unknown", "structured_output": False}
+
+
+class StubServer:
+    def __init__(self, request_overhead: float, step_cost: float, sequence_cost: float, output_tokens: int, max_num_seqs: int) -> None:
+        """
+        Stub of a vLLM server. The API frontend handles requests one at a time (parsing, tokenization and
+        response building cost `request_overhead` per HTTP request); generation runs in a continuous-batching
+        engine where each decode step costs `step_cost + sequence_cost * running sequences` and advances every
+        running sequence by one token, whichever request it came from.
+        """
+        self.request_overhead = request_overhead
+        self.step_cost = step_cost
+        self.sequence_cost = sequence_cost
+        self.output_tokens = output_tokens
+        self.max_num_seqs = max_num_seqs
+        self.requests = 0
+        self.steps = 0
+        self._frontend_lock = asyncio.Lock()
+        self._waiting: List[asyncio.Future] = []
+        self._has_work = asyncio.Event()
+        self._engine: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._engine = asyncio.ensure_future(self._run_engine())
+
+    def stop(self) -> None:
+        self._engine.cancel()
+
+    async def _run_engine(self) -> None:
+        running: List[List] = []  # [remaining tokens, future]
+        while True:
+            if not running and not self._waiting:
+                self._has_work.clear()
+                await self._has_work.wait()
+            while self._waiting and len(running) < self.max_num_seqs:
+                running.append([self.output_tokens, self._waiting.pop(0)])
+            await asyncio.sleep(self.step_cost + self.sequence_cost * len(running))
+            self.steps += 1
+            for sequence in running:
+                sequence[0] -= 1
+                if sequence[0] == 0:
+                    sequence[1].set_result(None)
+            running = [sequence for sequence in running if sequence[0] > 0]
+
+    async def generate(self, num_prompts: int) -> None:
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in range(num_prompts)]
+        self._waiting.extend(futures)
+        self._has_work.set()
+        await asyncio.gather(*futures)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                path = request_line.decode().split()[1]
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode().strip()
+                    if not line:
+                        break
+                    key, _, value = line.partition(":")
+                    headers[key.lower()] = value.strip()
+                raw = await reader.readexactly(int(headers.get("content-length", 0)))
+                if path.endswith("/stats"):
+                    payload = {"requests": self.requests, "steps": self.steps}
+                    self.requests, self.steps = 0, 0
+                else:
+                    payload = await self.respond(path, json.loads(raw))
+                data = json.dumps(payload).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, path: str, body: dict) -> dict:
+        prompts = body["prompt"] if path.endswith("/completions") and "prompt" in body else [None]
+        async with self._frontend_lock:
+            self.requests += 1
+            await asyncio.sleep(self.request_overhead)
+        await self.generate(len(prompts))
+        usage = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        if "messages" in body:
+            return {
+                "id": "chat", "object": "chat.completion", "created": 0, "model": MODEL,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "42"}}],
+                "usage": usage,
+            }
+        return {
+            "id": "cmpl", "object": "text_completion", "created": 0, "model": MODEL,
+            "choices": [{"index": i, "finish_reason": "stop", "text": "42"} for i in range(len(prompts))],
+            "usage": usage,
+        }
+
+
+async def serve(stub_args: Tuple, port_queue: multiprocessing.Queue) -> None:
+    stub = StubServer(*stub_args)
+    server = await asyncio.start_server(stub.handle, "127.0.0.1", 0)
+    stub.start()
+    port_queue.put(server.sockets[0].getsockname()[1])
+    async with server:
+        await server.serve_forever()
+
+
+def run_stub(stub_args: Tuple, port_queue: multiprocessing.Queue) -> None:
+    asyncio.run(serve(stub_args, port_queue))
+
+
+def render_prompt(chat_messages):
+    return "".join(f"<|{message['role']}|>\n{message['content']}\n" for message in chat_messages) + "<|assistant|>\n"
+
+
+async def run_calls(client, n: int, arrival_gap: float) -> Tuple[float, float]:
+    """
+    Issue n calls, one every `arrival_gap` seconds. Returns the wall time and the mean per-call latency.
+    """
+    latencies = []
+
+    async def call(i: int) -> None:
+        await asyncio.sleep(i * arrival_gap)
+        start = time.perf_counter()
+        result = await client.create([SystemMessage(content="You are a helpful assistant."), UserMessage(content=f"Question {i}", source="user")])
+        assert result.content == "42"
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(n)))
+    return time.perf_counter() - start, sum(latencies) / len(latencies)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark micro-batched completions against per-request chat completions.")
+    parser.add_argument("--n", type=int, default=256, help="Number of calls")
+    parser.add_argument("--arrival_ms", type=float, default=0, help="Gap between call arrivals, 0 sends all at once")
+    parser.add_argument("--window_ms", type=float, default=10)
+    parser.add_argument("--max_batch_size", type=int, default=32)
+    parser.add_argument("--request_overhead_ms", type=float, default=1, help="Simulated API frontend cost per HTTP request")
+    parser.add_argument("--step_ms", type=float, default=10, help="Simulated cost of one decode step")
+    parser.add_argument("--sequence_ms", type=float, default=0.05, help="Simulated decode step cost per running sequence")
+    parser.add_argument("--output_tokens", type=int, default=20)
+    parser.add_argument("--max_num_seqs", type=int, default=256, help="Running sequences per engine step, as in vLLM")
+    args = parser.parse_args()
+
+    stub_args = (args.request_overhead_ms / 1000, args.step_ms / 1000, args.sequence_ms / 1000, args.output_tokens, args.max_num_seqs)
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    stub_process = context.Process(target=run_stub, args=(stub_args, port_queue), daemon=True)
+    stub_process.start()
+    port = port_queue.get(timeout=30)
+    client_args = {"model": MODEL, "base_url": f"http://127.0.0.1:{port}/v1", "api_key": "placeholder", "temperature": 0.1, "max_tokens": 64}
+    arrival_gap = args.arrival_ms / 1000
+
+    http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=256))
+    chat_client = OpenAIChatCompletionClient(**client_args, model_info=MODEL_INFO, http_client=http_client, max_retries=0)
+
+    async def stub_counts() -> Tuple[int, int]:
+        stats = (await http_client.get(f"{client_args['base_url']}/stats")).json()
+        return stats["requests"], stats["steps"]
+
+    # Warm up first so both runs reuse open connections instead of timing connection setup.
+    await run_calls(chat_client, args.n, 0)
+    await stub_counts()
+
+    per_request, per_request_latency = await run_calls(chat_client, args.n, arrival_gap)
+    per_request_counts = await stub_counts()
+
+    batching_client = BatchingCompletionClient(
+        chat_client,
+        client_args,
+        http_client=http_client,
+        render_prompt=render_prompt,
+        batch_window=args.window_ms / 1000,
+        max_batch_size=args.max_batch_size,
+        name="bench",
+    )
+    batched, batched_latency = await run_calls(batching_client, args.n, arrival_gap)
+    batched_counts = await stub_counts()
+
+    await batching_client.close()
+    await http_client.aclose()
+    stub_process.terminate()
+
+    print(f"per-request: {args.n} calls in {per_request:.3f}s, mean latency {per_request_latency * 1000:.1f} ms "
+          f"({per_request_counts[0]} HTTP requests, {per_request_counts[1]} engine steps)")
+    print(f"batched:     {args.n} calls in {batched:.3f}s, mean latency {batched_latency * 1000:.1f} ms "
+          f"({batched_counts[0]} HTTP requests, {batched_counts[1]} engine steps, mean batch {batching_client.stats()['mean_batch_size']:.1f})")
+    print(f"wall time ratio (per-request / batched): {per_request / batched:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Microbenchmark of modules.bm25 against the previous rank_bm25.BM25Okapi implementation
+on real task contexts.
+
+    python scripts/bench_bm25.py --data_path data/bizBench/test-00000-of-00001-7b139510152259c8.parquet --dataset_name CodeFinQA
+"""
+import argparse
+import os
+import sys
+import time
+
+from rank_bm25 import BM25Okapi
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataloader.utils import load_and_prepare_dataset, dataset_to_task_inputs
+from modules.bm25 import BM25Model
+
+
+class RankBM25Model(BM25Model):
+    """
+    The previous implementation: BM25Okapi scoring followed by a full sort of all chunks.
+    """
+    def _setup_bm25_index(self, chunks):
+        self._bm25 = BM25Okapi([self._tokenize(chunk) for chunk in chunks])
+
+    def _search_bm25(self, query, top_k):
+        scores = self._bm25.get_scores(self._tokenize(query))
+        return sorted(zip(self._chunks, scores), key=lambda x: x[1], reverse=True)[:top_k]
+
+
+def time_model(model: BM25Model, task_inputs, top_k: int, repeat: int):
+    results = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [model.get_top_chunks(query=t.question, passage=t.context, top_k=top_k) for t in task_inputs]
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(task_inputs)), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BM25 chunk retrieval.")
+    parser.add_argument("--data_path", type=str, required=True, help="Path to Parquet data.")
+    parser.add_argument("--dataset_name", type=str, default="CodeFinQA")
+    parser.add_argument("--top_n", type=int, default=None, help="Limit the number of samples")
+    parser.add_argument("--top_k", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dataset = load_and_prepare_dataset(data_path=args.data_path, task_name=args.dataset_name, top_n=args.top_n)
+    task_inputs = [t for t in dataset_to_task_inputs(dataset) if isinstance(t.context, str) and t.context.strip()]
+
+    baseline_time, baseline = time_model(RankBM25Model(model_name="rank_bm25", cache_size=0), task_inputs, args.top_k, args.repeat)
+    sparse_time, sparse = time_model(BM25Model(model_name="sparse", cache_size=0), task_inputs, args.top_k, args.repeat)
+    cached_model = BM25Model(model_name="sparse_cached", cache_size=len(task_inputs))
+    cached_time, _ = time_model(cached_model, task_inputs, args.top_k, args.repeat)
+
+    mismatches = sum(
+        [round(c["score"], 6) for c in a] != [round(c["score"], 6) for c in b]
+        for a, b in zip(baseline, sparse)
+    )
+    print(f"Samples: {len(task_inputs)}, top_k: {args.top_k}, repeat: {args.repeat}")
+    print(f"rank_bm25 : {baseline_time * 1e3:.3f} ms / query")
+    print(f"sparse    : {sparse_time * 1e3:.3f} ms / query")
+    print(f"speedup   : {baseline_time / sparse_time:.2f}x")
+    print(f"sparse + index cache : {cached_time * 1e3:.3f} ms / query {cached_model.cache_info()}")
+    print(f"top-k score mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Microbenchmark of executor code execution: a fresh Python process per snippet (what the previous
+command-line executor did) against the warm InterpreterPool.
+
+    python scripts/bench_code_execution.py --n 200 --pool_size 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.code_execution import InterpreterPool
+
+SNIPPET = """import numpy as np
+revenue_2011 = 2045
+revenue_2012 = 1854
+answer = round((revenue_2011 - revenue_2012) / revenue_2011 * 100, 2)
+print(answer)
+"""
+
+
+async def run_fresh_process(code: str) -> str:
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "snippet.py")
+        with open(path, "w") as f:
+            f.write(code)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, path, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        stdout, _ = await process.communicate()
+        return stdout.decode()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark executor code execution.")
+    parser.add_argument("--n", type=int, default=200, help="Number of snippets")
+    parser.add_argument("--pool_size", type=int, default=4)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for _ in range(args.n):
+        await run_fresh_process(SNIPPET)
+    fresh_time = (time.perf_counter() - start) / args.n
+
+    pool = InterpreterPool(size=args.pool_size)
+    start = time.perf_counter()
+    await pool.start()
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.n):
+        await pool.execute(SNIPPET)
+    pool_time = (time.perf_counter() - start) / args.n
+
+    start = time.perf_counter()
+    await asyncio.gather(*(pool.execute(SNIPPET) for _ in range(args.n)))
+    pool_concurrent_time = (time.perf_counter() - start) / args.n
+    await pool.close()
+
+    print(f"Snippets: {args.n}, pool size: {args.pool_size}")
+    print(f"fresh process     : {fresh_time * 1e3:.2f} ms / snippet")
+    print(f"pool (sequential) : {pool_time * 1e3:.2f} ms / snippet (startup {startup:.2f} s, once)")
+    print(f"pool (concurrent) : {pool_concurrent_time * 1e3:.2f} ms / snippet")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""
+Regression check of the arithmetic fast path: ordinary snippets are evaluated in process, while snippets
+that would build huge numbers (chained powers, repeated squaring) are rejected quickly so that they run on
+the sandboxed backend instead of blocking the event loop. Format specs with huge widths or precisions are
+rejected the same way, and the output is truncated like the backends' output.
+
+    python scripts/check_arithmetic_fast_path.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.code_execution import evaluate_arithmetic
+
+EVALUATED = {
+    "revenue_2011 = 2045\nrevenue_2012 = 1854\nprint(round((revenue_2011 - revenue_2012) / revenue_2011 * 100, 2))\n": "9.34\n",
+    "rate = 0.05\nprint(round(1000 * (1 + rate) ** 10, 2))\n": "1628.89\n",
+    "x = 2 ** 100\nprint(x)\n": f"{2 ** 100}\n",
+    "growth = 0.0312\nprint(f\"{growth:>10.2%}\")\n": "     3.12%\n",
+    "total = 1234567.891\nprint(f\"{total:,.2f}\")\n": "1,234,567.89\n",
+}
+REJECTED = [
+    "x = 10**100\nx = x**100\nx = x**100\nx = x**100\nprint(1)\n",
+    "x = 10**100\nx = x*x\nx = x*x\nx = x*x\nx = x*x\nprint(1)\n",
+    "x = 1e200\nx = x * 1e200\nprint(x)\n",
+    "x = 3 ** 99\nx = x ** 99\nprint(x)\n",
+    "x = 1\nprint(f\"{x:>200000000}\")\n",
+    "x = 1.5\nprint(f\"{x:.200000000f}\")\n",
+    "x = 1\nw = 200000000\nprint(f\"{x:>{w}}\")\n",
+]
+MAX_OUTPUT_CHARS = 100
+
+
+def main():
+    failures = []
+    for code, expected in EVALUATED.items():
+        result = evaluate_arithmetic(code)
+        if result is None or result.stdout != expected:
+            failures.append(f"expected {expected!r} from {code!r}, got {result}")
+    for code in REJECTED:
+        start = time.perf_counter()
+        result = evaluate_arithmetic(code)
+        elapsed = time.perf_counter() - start
+        if result is not None or elapsed > 0.1:
+            failures.append(f"expected fast rejection of {code!r}, got {result} after {elapsed:.3f}s")
+
+    long_output = "x = 1\n" + "print(f\"{x:>100}\")\n" * 10
+    result = evaluate_arithmetic(long_output, max_output_chars=MAX_OUTPUT_CHARS)
+    if result is None or not result.stdout.startswith(" " * 99 + "1") or len(result.stdout) > MAX_OUTPUT_CHARS + 50:
+        failures.append(f"fast-path output was not truncated to {MAX_OUTPUT_CHARS} characters: {result}")
+
+    for failure in failures:
+        print(failure)
+    print(f"{len(EVALUATED) + len(REJECTED) + 1} snippets checked, {len(failures)} failures")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Regression checks of the micro-batching client against a recording transport: executor candidates that differ
+only in their seed share one /completions request (sent without a seed), calls with one common seed keep it,
+and locally rendered prompts are sent with add_special_tokens false.
+
+    python scripts/check_batching_client.py
+"""
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autogen_core.models import UserMessage
+
+from modules.batching_client import BatchingCompletionClient
+
+
+def recording_client(bodies: list) -> httpx.AsyncClient:
+    def handle(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        bodies.append(body)
+        choices = [{"index": i, "finish_reason": "stop", "text": str(i)} for i in range(len(body["prompt"]))]
+        return httpx.Response(200, json={"choices": choices})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handle))
+
+
+async def send(seeds: list) -> list:
+    bodies = []
+    http_client = recording_client(bodies)
+    client = BatchingCompletionClient(
+        None,
+        {"model": "stub-model", "base_url": "http://127.0.0.1:8000/v1", "temperature": 0.7},
+        http_client=http_client,
+        render_prompt=lambda chat_messages: chat_messages[-1]["content"],
+        batch_window=0.01,
+    )
+    messages = [UserMessage(content="Write the code.", source="user")]
+    await asyncio.gather(*(client.create(messages, extra_create_args={"seed": seed}) for seed in seeds))
+    await client.close()
+    await http_client.aclose()
+    return bodies
+
+
+async def main():
+    failures = []
+    bodies = await send(list(range(5)))
+    if len(bodies) != 1 or len(bodies[0]["prompt"]) != 5 or "seed" in bodies[0]:
+        failures.append(f"candidates with distinct seeds were not sent as one unseeded request: {bodies}")
+    bodies = await send([7, 7, 7])
+    if len(bodies) != 1 or bodies[0].get("seed") != 7:
+        failures.append(f"a batch with one common seed lost it: {bodies}")
+    if any(body.get("add_special_tokens") is not False for body in bodies):
+        failures.append(f"batched prompts were sent without add_special_tokens false: {bodies}")
+
+    for failure in failures:
+        print(failure)
+    print(f"3 batching checks, {len(failures)} failures")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""
+Regression checks of the adaptive concurrency limiter: a waiter that is cancelled after being woken must pass
+its wakeup on, a burst of waiters with random cancellations must never strand a slot, and steady traffic from
+clients with very different per-token latencies must not read as overload, and an endpoint timeout as reported
+by the OpenAI SDK must lower the limit.
+
+    python scripts/check_concurrency_limiter.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+import httpx
+import openai
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autogen_core.models import UserMessage
+
+from modules.endpoint_client import AdaptiveConcurrencyLimiter, LimitedChatCompletionClient, is_overload_error
+
+
+async def check_cancelled_after_wakeup() -> bool:
+    limiter = AdaptiveConcurrencyLimiter("check", initial_limit=1)
+    started = await limiter.acquire()
+    waiter_a = asyncio.ensure_future(limiter.acquire())
+    waiter_b = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    limiter.release(started)  # wakes A
+    waiter_a.cancel()  # A is cancelled before it resumes
+    try:
+        await asyncio.wait_for(waiter_b, timeout=1)
+    except asyncio.TimeoutError:
+        print(f"B never acquired the released slot (in_flight={limiter.in_flight})")
+        return False
+    return True
+
+
+async def check_random_cancellations(n: int = 2000, seed: int = 0) -> bool:
+    rng = random.Random(seed)
+    limiter = AdaptiveConcurrencyLimiter("check", initial_limit=4, max_limit=4)
+
+    async def worker():
+        started = await limiter.acquire()
+        try:
+            await asyncio.sleep(rng.random() * 0.001)
+        finally:
+            limiter.release(started)
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(n)]
+    for _ in range(n // 4):
+        await asyncio.sleep(0)
+        rng.choice(tasks).cancel()
+    done, pending = await asyncio.wait(tasks, timeout=10)
+    if pending or limiter.in_flight:
+        print(f"{len(pending)} workers stuck, in_flight={limiter.in_flight}")
+        return False
+    return True
+
+
+def check_latency_baselines() -> bool:
+    """
+    Short-output scoring calls (slow per token, mostly prefill) joining steady long generations (fast per token)
+    must not lower the limit; after a burst of unusually fast requests, a steady slower level must stop
+    lowering it once the baseline has caught up.
+    """
+    limiter = AdaptiveConcurrencyLimiter("check", initial_limit=32, max_limit=1024)
+
+    def sample(client: str, token_latency: float) -> None:
+        started = time.monotonic()
+        limiter.in_flight += 1
+        limiter.release(started, token_latency=token_latency, client=client)
+
+    for _ in range(200):
+        sample("executor_agent", 0.02)
+    for i in range(400):
+        sample("executor_agent" if i % 2 else "verifier_agent", 0.02 if i % 2 else 0.5)
+    if limiter.decreases:
+        print(f"mixed clients lowered the limit {limiter.decreases} times: {limiter.stats()}")
+        return False
+
+    for _ in range(50):
+        sample("executor_agent", 0.001)
+    for _ in range(800):
+        sample("executor_agent", 0.03)
+    decreases = limiter.decreases
+    for _ in range(200):
+        sample("executor_agent", 0.03)
+    if limiter.decreases != decreases:
+        print(f"baseline never caught up after a fast burst: {limiter.stats()}")
+        return False
+    return True
+
+
+class TimingOutClient:
+    async def create(self, messages, **kwargs):
+        raise openai.APITimeoutError(request=httpx.Request("POST", "http://127.0.0.1:8000/v1/chat/completions"))
+
+
+async def check_timeout_lowers_limit() -> bool:
+    error = openai.APITimeoutError(request=httpx.Request("POST", "http://127.0.0.1:8000/v1/chat/completions"))
+    if not is_overload_error(error):
+        print("openai.APITimeoutError is not treated as overload")
+        return False
+    limiter = AdaptiveConcurrencyLimiter("check", initial_limit=32)
+    client = LimitedChatCompletionClient(TimingOutClient(), limiter, max_retries=0, name="check")
+    try:
+        await client.create([UserMessage(content="question", source="user")])
+    except openai.APITimeoutError:
+        pass
+    if limiter.decreases != 1 or int(limiter.limit) != 16:
+        print(f"a timed out request did not lower the limit: {limiter.stats()}")
+        return False
+    return True
+
+
+async def main():
+    results = [
+        await check_cancelled_after_wakeup(),
+        await check_random_cancellations(),
+        check_latency_baselines(),
+        await check_timeout_lowers_limit(),
+    ]
+    print(f"{len(results)} limiter checks, {results.count(False)} failures")
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Regression checks of the interpreter pool: callers cancelled mid-request must not strand their worker, and a
+pool whose workers can no longer be respawned must fail fast instead of leaving callers waiting forever.
+
+    python scripts/check_interpreter_pool.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules import code_execution
+from modules.code_execution import InterpreterPool
+
+
+class FailingRespawnPool(InterpreterPool):
+    """
+    Starts normally, then every respawn fails.
+    """
+    started = False
+
+    async def _spawn(self):
+        if self.started:
+            raise RuntimeError("spawn failed")
+        return await super()._spawn()
+
+    async def start(self) -> None:
+        await super().start()
+        self.started = True
+
+
+async def cancel_mid_request(pool: InterpreterPool) -> None:
+    task = asyncio.ensure_future(pool.execute("import time\ntime.sleep(5)"))
+    await asyncio.sleep(0.5)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def check_cancelled_callers(cancellations: int = 3) -> bool:
+    pool = InterpreterPool(size=1, timeout=10)
+    try:
+        await pool.start()
+        for _ in range(cancellations):
+            await cancel_mid_request(pool)
+        try:
+            result = await asyncio.wait_for(pool.execute("print(6 * 7)"), timeout=20)
+        except asyncio.TimeoutError:
+            print(f"execute hung after {cancellations} cancelled callers (restarts={pool.restarts})")
+            return False
+        if result.status != "ok" or result.stdout.strip() != "42":
+            print(f"unexpected result after cancellations: {result}")
+            return False
+        return True
+    finally:
+        await pool.close()
+
+
+async def check_failed_respawn() -> bool:
+    code_execution.SPAWN_BACKOFF = 0.01
+    pool = FailingRespawnPool(size=1, timeout=10)
+    try:
+        await pool.start()
+        # The waiter queues up behind the cancelled call and is woken when the pool gives up on the worker.
+        task = asyncio.ensure_future(pool.execute("import time\ntime.sleep(5)"))
+        await asyncio.sleep(0.5)
+        waiter = asyncio.ensure_future(pool.execute("print(1)"))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        try:
+            results = await asyncio.wait_for(asyncio.gather(waiter, pool.execute("print(2)")), timeout=10)
+        except asyncio.TimeoutError:
+            print("execute hung after the pool could not respawn its worker")
+            return False
+        if any(result.status != "crashed" for result in results):
+            print(f"expected fast failures from an empty pool: {results}")
+            return False
+        return True
+    finally:
+        await pool.close()
+
+
+async def main():
+    results = [await check_cancelled_callers(), await check_failed_respawn()]
+    print(f"{len(results)} interpreter pool checks, {results.count(False)} failures")
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
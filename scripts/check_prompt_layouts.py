@@ -0,0 +1,55 @@
+"""
+Regression check of the prompt layouts: for every prompt builder, the "default" and "prefix_cache" layouts must
+contain exactly the same lines, only in a different order, so that an edit to one layout's text cannot leave
+the other behind.
+
+    python scripts/check_prompt_layouts.py
+"""
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import (
+    construct_action_evaluation_prompt,
+    construct_batch_action_evaluation_prompt,
+    construct_execute_review_prompt,
+    construct_executor_prompt,
+    construct_executor_refine_prompt,
+    construct_executor_retry_prompt,
+    construct_extractor_prompt_1_turn,
+    construct_review_extractor_prompt,
+)
+
+BUILDERS = {
+    "executor": lambda layout: construct_executor_prompt("FORMULA", "VALUES", "QUESTION", layout=layout),
+    "executor_refine": lambda layout: construct_executor_refine_prompt("FORMULA", "VALUES", "CODE", "REVIEW", "QUESTION", layout=layout),
+    "executor_retry": lambda layout: construct_executor_retry_prompt("ERROR", "BASE PROMPT\n", "CODE", layout=layout),
+    "execute_review": lambda layout: construct_execute_review_prompt("CODE", "RESULT", layout=layout),
+    "action_evaluation": lambda layout: construct_action_evaluation_prompt("QUESTION", "CONTEXT", "REASON_ACTION_ClAIFY", layout=layout),
+    "batch_action_evaluation": lambda layout: construct_batch_action_evaluation_prompt(
+        "QUESTION", "CONTEXT", ["REASON_ACTION_ClAIFY", "REASON_ACTION_IDENTIFY_VAR"], layout=layout),
+    "extractor": lambda layout: construct_extractor_prompt_1_turn("VARIABLES", "CHUNKS", "QUESTION", layout=layout),
+    "review_extractor": lambda layout: construct_review_extractor_prompt("QUESTION", "CONTEXT", "RESULTS", layout=layout),
+}
+
+
+def main():
+    failures = []
+    for name, build in BUILDERS.items():
+        default, prefix_cache = Counter(build("default").splitlines()), Counter(build("prefix_cache").splitlines())
+        if default != prefix_cache:
+            only_default = list((default - prefix_cache).elements())
+            only_prefix_cache = list((prefix_cache - default).elements())
+            failures.append(f"{name}: only in default {only_default}, only in prefix_cache {only_prefix_cache}")
+
+    for failure in failures:
+        print(failure)
+    print(f"{len(BUILDERS)} prompt builders checked, {len(failures)} failures")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
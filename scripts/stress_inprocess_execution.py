@@ -0,0 +1,65 @@
+"""
+Stress check of in-process code execution: runs many snippets concurrently on a thread pool and verifies
+that every snippet's output is attributed to that snippet only. --legacy runs the previous sys.stdout
+swapping implementation for comparison.
+
+    python scripts/stress_inprocess_execution.py --n 500 --threads 32
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.code_execution import ExecutionResult, execute_in_process
+
+
+def legacy_execute_in_process(code: str) -> ExecutionResult:
+    old_stdout = sys.stdout
+    sys.stdout = buffer = io.StringIO()
+    try:
+        exec(textwrap.dedent(code).lstrip(), {})
+    finally:
+        sys.stdout = old_stdout
+    return ExecutionResult(status="ok", stdout=buffer.getvalue())
+
+
+def make_snippet(i: int) -> str:
+    # Sleeps between prints release the GIL so snippets interleave.
+    return (
+        "import time\n"
+        f"for step in range(5):\n"
+        f"    print('snippet-{i}', step)\n"
+        f"    time.sleep(0.001)\n"
+    )
+
+
+def expected_output(i: int) -> str:
+    return "".join(f"snippet-{i} {step}\n" for step in range(5))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Concurrent in-process execution stress check.")
+    parser.add_argument("--n", type=int, default=500, help="Number of snippets")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--legacy", action="store_true", help="Use the previous sys.stdout swapping implementation")
+    args = parser.parse_args()
+
+    execute = legacy_execute_in_process if args.legacy else execute_in_process
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = await asyncio.gather(*(loop.run_in_executor(pool, execute, make_snippet(i)) for i in range(args.n)))
+
+    wrong = [i for i, result in enumerate(results) if result.stdout != expected_output(i)]
+    # The legacy implementation can leave sys.stdout pointing at a snippet buffer.
+    print(f"{args.n} snippets on {args.threads} threads: {len(wrong)} with misattributed output", file=sys.__stdout__)
+    if wrong:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())